@@ -1,4 +1,5 @@
-from agents import *
+from agents import (AddAgent, DivideAgent, IdentifyOperandsAgent, LLMAgent,
+                    MultiplyAgent, SubtractAgent)
 
 class AgentRegistry:
     """
@@ -124,6 +125,19 @@ class AgentRegistry:
         agent_info = self.agents.get(agent_name, None)
         return agent_info["default_config"] if agent_info else None
 
+    def get_agent_description(self, agent_name):
+        """
+        Retrieves the description of the specified agent.
+
+        Args:
+            agent_name (str): The name of the agent.
+
+        Returns:
+            str: The description of the agent, or None if not found.
+        """
+        agent_info = self.agents.get(agent_name, None)
+        return agent_info["description"] if agent_info else None
+
     def get_agents_names(self):
         """
         Retrieves a list of all agent names.
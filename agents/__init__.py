@@ -1,3 +1,25 @@
-from .arithmetic_agents import *
-from .llm_agents import *
-from .search_agents import *
\ No newline at end of file
+import importlib
+
+# agent modules are imported on first access, so e.g. the search agent's
+# dependencies are only loaded when it is actually used
+_AGENT_MODULES = {
+    "BaseAgent": ".base_agent",
+    "AddAgent": ".arithmetic_agents",
+    "MultiplyAgent": ".arithmetic_agents",
+    "SubtractAgent": ".arithmetic_agents",
+    "DivideAgent": ".arithmetic_agents",
+    "LLMAgent": ".llm_agents",
+    "IdentifyOperandsAgent": ".llm_agents",
+    "LLM_AGENT_REGISTRY": ".llm_agents",
+    "WebSearchAgent": ".search_agents",
+}
+
+__all__ = list(_AGENT_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _AGENT_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_AGENT_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
\ No newline at end of file
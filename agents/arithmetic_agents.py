@@ -4,51 +4,88 @@ from .base_agent import BaseAgent
 
 
 class AddAgent(BaseAgent):
+    local = True
+    min_inputs = 1
+    num_outputs = 1
+    numeric_inputs = True
+
     def __init__(self):
         self.config = {}
     def execute(self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict) -> dict:
         operands = [float(val) for _, val in input_vars]
         return {
-            output_vars[0]: sum(operands)
+            output_vars[0]: self.compute(operands)
         }
 
+    @staticmethod
+    def compute(operands: list[float]) -> float:
+        return sum(operands)
+
 
 class MultiplyAgent(BaseAgent):
+    local = True
+    min_inputs = 1
+    num_outputs = 1
+    numeric_inputs = True
+
     def __init__(self):
         self.config = {}
     def execute(self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict) -> dict:
-        result = 1
         operands = [float(val) for _, val in input_vars]
-        for operand in operands:
-            result *= operand
         return {
-            output_vars[0]: result
+            output_vars[0]: self.compute(operands)
         }
 
+    @staticmethod
+    def compute(operands: list[float]) -> float:
+        result = 1
+        for operand in operands:
+            result *= operand
+        return result
+
 
 class SubtractAgent(BaseAgent):
+    local = True
+    min_inputs = 2
+    num_outputs = 1
+    numeric_inputs = True
+
     def __init__(self):
         self.config = {}
     def execute(self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict) -> dict:
         operands = [float(val) for _, val in input_vars]
+        return {
+            output_vars[0]: self.compute(operands)
+        }
+
+    @staticmethod
+    def compute(operands: list[float]) -> float:
         result = operands[0]
         for operand in operands[1:]:
             result -= operand
-        return {
-            output_vars[0]: result
-        }
+        return result
 
 
 class DivideAgent(BaseAgent):
+    local = True
+    min_inputs = 2
+    num_outputs = 1
+    numeric_inputs = True
+
     def __init__(self):
         self.config = {}
     def execute(self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict) -> dict:
         operands = [float(val) for _, val in input_vars]
         if 0 in operands[1:]:
             return "Error: Division by zero"
+        return {
+            output_vars[0]: self.compute(operands)
+        }
+
+    @staticmethod
+    def compute(operands: list[float]) -> float:
+        """Raises ZeroDivisionError where execute() reports the error as its result."""
         result = operands[0]
         for operand in operands[1:]:
             result /= operand
-        return {
-            output_vars[0]: result
-        }
\ No newline at end of file
+        return result
\ No newline at end of file
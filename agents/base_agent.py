@@ -7,7 +7,26 @@ class BaseAgent(ABC):
     """
     Abstract base class for agents.
     All agents must implement the execute() method.
+
+    Attributes:
+        exec_policy (dict): Default timeout, retry and hedging policy applied by the executor
+            (see execution_policy.ExecutionPolicy); node params with the same keys override it.
+        local (bool): Whether execute() is a pure in-process computation on the input values,
+            so its result depends only on the values and not on input or output names.
+        local_fast_path (str | None): Node param switching a local attempt that execute() makes
+            before calling the LLM (on by default), or None if the agent has none. Batched and
+            chained LLM calls make the attempt first and only send the nodes it cannot answer.
+        min_inputs (int): Fewest inputs a node of the agent can be executed with.
+        num_outputs (int | None): Number of outputs the agent produces, or None if it answers any output names.
+        numeric_inputs (bool): Whether every input value must be a number.
     """
+    exec_policy: dict = {}
+    local: bool = False
+    local_fast_path: str | None = None
+    min_inputs: int = 0
+    num_outputs: int | None = None
+    numeric_inputs: bool = False
+
     @abstractmethod
     def execute(self, task: str, input_vars: NodeInputVars, output_vars: list[str], *args, **kwargs) -> dict:
         """
@@ -2,9 +2,14 @@ import json
 from textwrap import dedent
 
 from custom_types import NodeInputVars
-from utils import openai_client
+from llm_scheduler import Priority, scheduler
+from metrics import local_fast_path_total
+from model_cascade import cascade_models, run_cascade
+from utils import get_agent_openai_client
 
 from .base_agent import BaseAgent
+from .local_evaluation import evaluate_task
+from .local_extraction import LOCAL_CONFIDENCE, extract_operands
 
 
 LLM_AGENT_REGISTRY = {
@@ -106,9 +111,21 @@ LLM_AGENT_REGISTRY = {
         "output_format": "any",
     },
 }
+# params read by the agents themselves, never sent to the model
+AGENT_PARAMS = ("local_extraction", "local_confidence", "local_evaluation", "cascade")
+
+
+def _check_outputs(output_vars: list[str]):
+    """Returns a cascade check rejecting answers that miss one of the output keys."""
+    def check(response_obj) -> None:
+        if not isinstance(response_obj, dict) or any(key not in response_obj for key in output_vars):
+            raise ValueError(f"Response misses output keys of {output_vars}")
+    return check
 
 
 class LLMAgent(BaseAgent):
+    exec_policy = {"timeout": 60, "max_retries": 2}
+
     def __init__(
         self,
         agent: str,
@@ -116,9 +133,15 @@ class LLMAgent(BaseAgent):
     ):
         self.agent_name = agent
         self.config = config
-        self.client = openai_client
+        # tasks the planner could not map to an agent are often simple computations
+        self.local_fast_path = "local_evaluation" if agent == "fallback" else None
         self.set_system_prompt()
 
+    @property
+    def client(self):
+        # built on the first call, so listing the registry does not load the OpenAI SDK
+        return get_agent_openai_client()
+
     def set_system_prompt(self):
         """
         Sets the system prompt for the specific LLM agent based on the agent's description.
@@ -131,12 +154,33 @@ class LLMAgent(BaseAgent):
             Your answer should be in JSON, with given output keys and output values in {agent['output_format']}."""
         )
 
+    def answer_locally(
+        self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict
+    ) -> dict | None:
+        """
+        Computes the task without the LLM if the agent has a local fast path that the params do not
+        switch off: the fallback agent's `local_evaluation` (see local_evaluation.evaluate_task()).
+        Returns None if the task must go to the LLM.
+        """
+        if not self.local_fast_path or not params.get(self.local_fast_path, True):
+            return None
+        result = evaluate_task(task, input_vars, output_vars)
+        local_fast_path_total.inc(site="fallback", outcome="miss" if result is None else "hit")
+        return result
+
     def execute(
         self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict
     ) -> dict:
         """
-        Executes the LLM agent using the OpenAI API.
+        Executes the LLM agent using the OpenAI API, through the model cascade (see model_cascade):
+        answers of cheaper models that miss an output key are requested again from the next model.
+        The task is first computed locally when possible (see answer_locally()).
         """
+        result = self.answer_locally(task, input_vars, output_vars, params)
+        if result is not None:
+            return result
+        params = dict(params)
+        params.pop("local_evaluation", None)
         prompt = "Task: {task}\n\nInput: {input_vars}\n\nOutput keys: {output_vars}"
         messages = [
             {"role": "system", "content": self.system_prompt},
@@ -149,20 +193,162 @@ class LLMAgent(BaseAgent):
         ]
         config = self.config.copy()
         config.update(params)
-        response = self.client.chat.completions.create(
-            messages=messages, **config, response_format={"type": "json_object"}
+        models = cascade_models(config.pop("model"), config.pop("cascade", None))
+
+        def call(model: str) -> dict:
+            with scheduler.slot(Priority.BULK, messages, site="llm_agent") as slot:
+                response = self.client.chat.completions.create(
+                    messages=messages, model=model, **config, response_format={"type": "json_object"}
+                )
+                slot.record(response)
+            return json.loads(response.choices[0].message.content)
+
+        return run_cascade(call, _check_outputs(output_vars), models, site="llm_agent")
+
+    @staticmethod
+    def execute_batch(tasks: dict[str, tuple["LLMAgent", str, NodeInputVars, list[str]]], params: dict) -> dict:
+        """
+        Executes several independent tasks of LLM agents in a single call, through the model
+        cascade like LLMAgent.execute(): a response of a cheaper model that is not JSON or misses
+        a task or an output key is requested again from the next model.
+
+        Args:
+            tasks (dict): Task id to (agent, task, input_vars, output_vars).
+            params (dict): Model config shared by all the tasks, e.g. model and temperature.
+
+        Returns:
+            dict: Task id to the output of that task, keyed by its output variables.
+
+        Raises:
+            ValueError: If the response of the last model is not JSON or misses a task or one of its output keys.
+        """
+        system_prompt = dedent(
+            """
+            You are a helpful assistant completing several independent tasks at once. Each task names the kind of work to do, its input and its output keys.
+            Keep your answers concise and short. Do not explain.
+            Your answer should be in JSON, with one key per task id whose value is a JSON object with the output keys of that task."""
         )
-        response_obj = json.loads(response.choices[0].message.content)
-        return response_obj
+        prompt = "Task id: {id}\nKind: {kind}, {description}; answer with {output} in {output_format}\nTask: {task}\n\nInput: {input_vars}\n\nOutput keys: {output_vars}"
+        blocks = []
+        for task_id, (agent, task, input_vars, output_vars) in tasks.items():
+            blocks.append(prompt.format(
+                id=task_id, kind=agent.agent_name, task=task, input_vars=input_vars,
+                output_vars=output_vars, **LLM_AGENT_REGISTRY[agent.agent_name],
+            ))
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "\n\n---\n\n".join(blocks)},
+        ]
+        config = {key: value for key, value in params.items() if key not in AGENT_PARAMS}
+        models = cascade_models(config.pop("model"), params.get("cascade"))
+
+        def call(model: str) -> dict:
+            with scheduler.slot(Priority.BULK, messages, site="llm_agent_batch") as slot:
+                response = get_agent_openai_client().chat.completions.create(
+                    messages=messages, model=model, **config, response_format={"type": "json_object"}
+                )
+                slot.record(response)
+            try:
+                response_obj = json.loads(response.choices[0].message.content)
+            except (json.JSONDecodeError, TypeError) as ex:
+                raise ValueError("Batched response is not valid JSON") from ex
+
+            results = {}
+            for task_id, (_, _, _, output_vars) in tasks.items():
+                result = response_obj.get(task_id) if isinstance(response_obj, dict) else None
+                if not isinstance(result, dict) or any(key not in result for key in output_vars):
+                    raise ValueError(f"Batched response has no complete output for task {task_id}")
+                results[task_id] = result
+            return results
 
+        return run_cascade(call, lambda results: None, models, site="llm_agent_batch")
+
+
+    @staticmethod
+    def execute_chain(steps: dict[str, tuple[str, str, NodeInputVars, list[str]]], params: dict) -> dict:
+        """
+        Executes a chain of dependent tasks in a single call, returning the output of every step.
+        The call goes through the model cascade, like execute_batch().
+
+        Args:
+            steps (dict): Step id to (description, task, input_vars, output_vars), in chain order.
+                Inputs produced by an earlier step are given as a reference to that step's output.
+            params (dict): Model config shared by all the steps, e.g. model and temperature.
+
+        Returns:
+            dict: Step id to the output of that step, keyed by its output variables.
+
+        Raises:
+            ValueError: If the response of the last model is not JSON or misses a step or one of its output keys.
+        """
+        system_prompt = dedent(
+            """
+            You are a helpful assistant completing a chain of tasks in order. A step may use outputs of earlier steps as its input; use the values you computed for them.
+            Keep your answers concise and short. Do not explain.
+            Your answer should be in JSON, with one key per step id whose value is a JSON object with the output keys of that step."""
+        )
+        prompt = "Step id: {id}\nKind: {description}\nTask: {task}\n\nInput: {input_vars}\n\nOutput keys: {output_vars}"
+        blocks = [
+            prompt.format(id=step_id, description=description, task=task, input_vars=input_vars, output_vars=output_vars)
+            for step_id, (description, task, input_vars, output_vars) in steps.items()
+        ]
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "\n\n---\n\n".join(blocks)},
+        ]
+        config = {key: value for key, value in params.items() if key not in AGENT_PARAMS}
+        models = cascade_models(config.pop("model"), params.get("cascade"))
+
+        def call(model: str) -> dict:
+            with scheduler.slot(Priority.BULK, messages, site="llm_agent_chain") as slot:
+                response = get_agent_openai_client().chat.completions.create(
+                    messages=messages, model=model, **config, response_format={"type": "json_object"}
+                )
+                slot.record(response)
+            try:
+                response_obj = json.loads(response.choices[0].message.content)
+            except (json.JSONDecodeError, TypeError) as ex:
+                raise ValueError("Chained response is not valid JSON") from ex
+
+            results = {}
+            for step_id, (_, _, _, output_vars) in steps.items():
+                result = response_obj.get(step_id) if isinstance(response_obj, dict) else None
+                if not isinstance(result, dict) or any(key not in result for key in output_vars):
+                    raise ValueError(f"Chained response has no complete output for step {step_id}")
+                results[step_id] = result
+            return results
+
+        return run_cascade(call, lambda results: None, models, site="llm_agent_chain")
+
+
+class IdentifyOperandsAgent(BaseAgent):
+    exec_policy = {"timeout": 60, "max_retries": 2}
+    local_fast_path = "local_extraction"
 
-class IdentifyOperandsAgent:
     def __init__(self):
         self.config = {"model": "gpt-4o", "temperature": 0}
     def execute(
         self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict
     ) -> dict:
-        """Extracts numeric operands from a given expression."""
+        """
+        Extracts numeric operands from a given expression.
+
+        The operands are first matched locally against the numbers of the input text; the LLM is
+        only called when that fails or is not confident enough. Params `local_extraction` (default
+        True) and `local_confidence` (default LOCAL_CONFIDENCE) control this step. The LLM call goes
+        through the model cascade, like LLMAgent.execute().
+        """
+        params = dict(params)
+        use_local = params.pop("local_extraction", True)
+        min_confidence = params.pop("local_confidence", LOCAL_CONFIDENCE)
+        if use_local:
+            text = " ".join(str(value) for _, value in input_vars if isinstance(value, str)) or task
+            values, confidence = extract_operands(text, output_vars)
+            if values is not None and confidence >= min_confidence:
+                local_fast_path_total.inc(site="identify_operands", outcome="hit")
+                return values
+            local_fast_path_total.inc(site="identify_operands", outcome="miss")
+
         GSM_PROMPT_ID = """
             From a given mathematical task extract the required expressions and their value from the text. 
             Only extract those expressions which has been mentioned in the task. Use the query to obtain values.
@@ -184,8 +370,14 @@ class IdentifyOperandsAgent:
         ]
         config = self.config.copy()
         config.update(params)
-        response = openai_client.beta.chat.completions.parse(
-            messages=messages, **config, response_format={"type": "json_object"}
-        )
-        response_obj = json.loads(response.choices[0].message.content)
-        return response_obj
+        models = cascade_models(config.pop("model"), config.pop("cascade", None))
+
+        def call(model: str) -> dict:
+            with scheduler.slot(Priority.BULK, messages, site="identify_operands") as slot:
+                response = get_agent_openai_client().beta.chat.completions.parse(
+                    messages=messages, model=model, **config, response_format={"type": "json_object"}
+                )
+                slot.record(response)
+            return json.loads(response.choices[0].message.content)
+
+        return run_cascade(call, _check_outputs(output_vars), models, site="identify_operands")
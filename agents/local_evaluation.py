@@ -0,0 +1,283 @@
+import ast
+import math
+import operator
+import re
+from itertools import permutations
+
+from .local_extraction import parse_number
+
+# unit -> (dimension, size in the base unit of that dimension)
+UNITS = {
+    "second": ("time", 1), "sec": ("time", 1), "minute": ("time", 60), "min": ("time", 60),
+    "hour": ("time", 3600), "hr": ("time", 3600), "day": ("time", 86400), "week": ("time", 604800),
+    "millimeter": ("length", 0.001), "mm": ("length", 0.001), "centimeter": ("length", 0.01),
+    "cm": ("length", 0.01), "meter": ("length", 1), "m": ("length", 1), "kilometer": ("length", 1000),
+    "km": ("length", 1000), "inch": ("length", 0.0254), "foot": ("length", 0.3048),
+    "feet": ("length", 0.3048), "ft": ("length", 0.3048), "yard": ("length", 0.9144),
+    "mile": ("length", 1609.344),
+    "milligram": ("mass", 0.001), "mg": ("mass", 0.001), "gram": ("mass", 1), "g": ("mass", 1),
+    "kilogram": ("mass", 1000), "kg": ("mass", 1000), "pound": ("mass", 453.59237),
+    "lb": ("mass", 453.59237), "ounce": ("mass", 28.349523125), "oz": ("mass", 28.349523125),
+    "milliliter": ("volume", 0.001), "ml": ("volume", 0.001), "liter": ("volume", 1),
+    "l": ("volume", 1), "gallon": ("volume", 3.785411784),
+}
+# quantities, rounding and further steps that none of the readings capture, e.g. "the minimum
+# number of buses needed" or "the percent left after spending"; words of the input names are allowed
+_AMBIGUOUS = {
+    "least", "most", "each", "every", "per", "left", "remain", "remains", "remaining", "remainder",
+    "include", "includes", "including", "excluding", "except", "without", "round", "rounded",
+    "nearest", "need", "needed", "then", "after", "before", "plus", "minus", "times", "twice",
+    "double", "triple", "half", "more", "less", "fewer", "than", "increase", "increased",
+    "decrease", "decreased", "discount", "discounted", "tax", "tip",
+}
+_ABBREVIATIONS = {
+    "num": "number", "no": "number", "nr": "number", "qty": "quantity", "pct": "percent",
+    "avg": "average", "amt": "amount", "cnt": "count", "tot": "total",
+}
+_STOPWORDS = {"the", "a", "an", "of"}
+MAX_NAMED_INPUTS = 6
+# an operand phrase ends at punctuation, at the end of the task or before e.g. "to get the total"
+_END = r"(?=\s*[.:;?!()]|\s*$|\s+to\s+(?:get|find|obtain|calculate|compute|give)\b)"
+# verb -> connectors between its two operands, and the result of the operands in order
+_OPERATIONS = {
+    verb: operation
+    for verbs, operation in (
+        (("multiply", "multiplying"), (("with", "and", "by"), operator.mul)),
+        (("add", "adding"), (("to", "and", "with"), operator.add)),
+        (("subtract", "subtracting"), (("from",), lambda subtrahend, minuend: minuend - subtrahend)),
+        (("divide", "dividing"), (("by",), operator.truediv)),
+    )
+    for verb in verbs
+}
+_OPERATION = re.compile(rf"\b({'|'.join(_OPERATIONS)})\s+(.+?)" + _END)
+_AGGREGATE = re.compile(
+    r"\b(average|mean|sum|minimum|min|smallest|lowest|maximum|max|largest|highest|greatest)\s+of\s+(.+?)" + _END
+)
+_AGGREGATES = {
+    "average": lambda numbers: sum(numbers) / len(numbers), "mean": lambda numbers: sum(numbers) / len(numbers),
+    "sum": sum, "minimum": min, "min": min, "smallest": min, "lowest": min,
+    "maximum": max, "max": max, "largest": max, "highest": max, "greatest": max,
+}
+_PERCENT_OF_LITERAL = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent\b)\s*of\s+(.+?)" + _END)
+_PERCENT_OF = re.compile(r"([^.:;,?!%\d]+?)(?<!as a)\s+percent\s+of\s+(.+?)" + _END)
+_AS_PERCENT_OF = re.compile(r"([^.:;,?!%]+?)\s+as\s+a\s+percent(?:age)?\s+of\s+(.+?)" + _END)
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+MAX_EXPONENT = 100
+_EXPRESSION = re.compile(r"(?:[\d.()+\-*/ ]|\bv\d+\b)+")
+_CONVERSION = re.compile(r"\b([a-z]+)\s+(?:to|into)\s+([a-z]+)\b")
+
+
+def _unit(word: str) -> tuple[str, float] | None:
+    if word in UNITS:
+        return UNITS[word]
+    if word.endswith("es") and word[:-2] in UNITS:
+        return UNITS[word[:-2]]
+    if word.endswith("s") and word[:-1] in UNITS:
+        return UNITS[word[:-1]]
+    return None
+
+
+def _words(text: str) -> list[str]:
+    """Words of a text or an input name, with abbreviations spelled out and plurals made singular."""
+    words = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        word = _ABBREVIATIONS.get(word, word)
+        if len(word) > 3 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def _name_words(name: str) -> set[str]:
+    """Words that a phrase must contain to name an input, e.g. {"number", "cluster"} for "num_clusters"."""
+    words = set(_words(name))
+    return words - _STOPWORDS or words
+
+
+def _assign(parts: list[str], names: dict[str, set[str]]) -> list[str] | None:
+    """
+    Matches phrases of the task to the inputs they name: a phrase names an input if it has all
+    the words of the input's name. Returns the input of each phrase, in order, if there is
+    exactly one way to name every input once.
+    """
+    if len(parts) != len(names) or len(names) > MAX_NAMED_INPUTS:
+        return None
+    part_words = [set(_words(part)) for part in parts]
+    matches = [
+        order for order in permutations(names)
+        if all(names[name] <= words for name, words in zip(order, part_words))
+    ]
+    return list(matches[0]) if len(matches) == 1 else None
+
+
+def _operations(text: str, values: dict[str, float], names: dict[str, set[str]]) -> list[float]:
+    """Results of operations on two named inputs, e.g. "by multiplying the number of clusters with the fruits per cluster"."""
+    results = []
+    if len(values) != 2:
+        return results
+    for verb, operands in _OPERATION.findall(text):
+        connectors, apply = _OPERATIONS[verb]
+        for connector in re.finditer(rf"\s({'|'.join(connectors)})\s", operands):
+            order = _assign([operands[:connector.start()], operands[connector.end():]], names)
+            if order:
+                try:
+                    results.append(apply(values[order[0]], values[order[1]]))
+                except ZeroDivisionError:
+                    continue
+    return results
+
+
+def _aggregates(text: str, values: dict[str, float], names: dict[str, set[str]]) -> list[float]:
+    """Averages, sums, minimums and maximums of all the inputs, named in a list, e.g. "the average of a, b and c"."""
+    results = []
+    if len(values) < 2:
+        return results
+    for kind, listed in _AGGREGATE.findall(text):
+        order = _assign(re.split(r"\s*,\s*(?:and\s+)?|\s+and\s+", listed), names)
+        if order:
+            results.append(_AGGREGATES[kind]([values[name] for name in order]))
+    return results
+
+
+def _percentages(text: str, values: dict[str, float], names: dict[str, set[str]]) -> list[float]:
+    """Percentages of a named input ("20% of the bill", "rate percent of price") and ratios as one ("red as a percentage of total")."""
+    results = []
+    if len(values) == 1:
+        for rate, whole in _PERCENT_OF_LITERAL.findall(text):
+            if _assign([whole], names):
+                results.append(float(rate) * next(iter(values.values())) / 100)
+    elif len(values) == 2:
+        for rate, whole in _PERCENT_OF.findall(text):
+            if order := _assign([rate, whole], names):
+                results.append(values[order[0]] * values[order[1]] / 100)
+        for part, whole in _AS_PERCENT_OF.findall(text):
+            if order := _assign([part, whole], names):
+                try:
+                    results.append(values[order[0]] / values[order[1]] * 100)
+                except ZeroDivisionError:
+                    continue
+    return results
+
+
+def _safe_eval(node: ast.AST, names: dict[str, float]) -> float:
+    """Evaluates arithmetic on numbers and the given names; anything else raises ValueError."""
+    if isinstance(node, ast.Expression):
+        return _safe_eval(node.body, names)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_safe_eval(node.operand, names))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _safe_eval(node.left, names), _safe_eval(node.right, names)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError("Exponent too large")
+        return _OPERATORS[type(node.op)](left, right)
+    raise ValueError(f"Unsupported expression: {ast.dump(node)}")
+
+
+def _substitute(text: str, values: dict[str, float]) -> tuple[str, dict[str, float]]:
+    """Replaces the input names in the task by v0, v1, ..., returning the text and the values by new name."""
+    names = {}
+    for i, name in enumerate(sorted(values, key=len, reverse=True)):
+        text, count = re.subn(rf"\b{re.escape(name.lower())}\b", f"v{i}", text)
+        if count:
+            names[f"v{i}"] = values[name]
+    return text, names
+
+
+def _expression(text: str, names: dict[str, float], inputs: int) -> float | None:
+    """Evaluates the only formula in the task, if it uses every input, e.g. "total = price * quantity"."""
+    if len(names) != inputs:
+        return None
+    text = text.replace("×", "*").replace("÷", "/").replace("^", "**")
+    candidates = [
+        match.group().strip() for match in _EXPRESSION.finditer(text)
+        if re.search(r"\bv\d+\b", match.group()) and re.search(r"[+\-*/]", match.group())
+    ]
+    if len(candidates) != 1 or set(re.findall(r"\bv\d+\b", candidates[0])) != set(names):
+        return None
+    try:
+        return _safe_eval(ast.parse(candidates[0], mode="eval"), names)
+    except (SyntaxError, ValueError, ArithmeticError):
+        return None
+
+
+def _conversion(text: str, values: list[float]) -> float | None:
+    """Converts the only input between the two units of the same dimension named in the task."""
+    if len(values) != 1:
+        return None
+    pairs = {
+        (source, target) for source, target in _CONVERSION.findall(text)
+        if _unit(source) and _unit(target) and _unit(source)[0] == _unit(target)[0]
+    }
+    if len(pairs) != 1:
+        return None
+    ((source, target),) = pairs
+    return values[0] * _unit(source)[1] / _unit(target)[1]
+
+
+def evaluate_task(task: str, input_vars: list, output_vars: list[str]) -> dict | None:
+    """
+    Computes a pure operation over exactly the inputs locally. The readings are a formula over all
+    the input names, an operation on two inputs named in the task ("by multiplying the number of
+    clusters with the number of fruits per cluster"), the average, sum, minimum or maximum of all
+    the inputs ("the average of a, b and c"), a percentage of an input ("20% of the bill") or of
+    one input as a percentage of the other, and a unit conversion of the only input.
+
+    Anything else is left to the LLM: tasks matching no reading, or readings that disagree,
+    tasks naming quantities or steps no reading captures (see _AMBIGUOUS, e.g. "each", "per",
+    "left", "needed"), non-numeric inputs, more than one output, and results too large to be
+    a float.
+
+    Args:
+        task (str): Task description of the node.
+        input_vars (list): Input name and value pairs.
+        output_vars (list[str]): Output names of the node.
+
+    Returns:
+        dict | None: The output name to the computed value, or None if the task was not recognized.
+    """
+    if len(output_vars) != 1 or not input_vars:
+        return None
+    values = {}
+    for name, value in input_vars:
+        number = value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+        if isinstance(value, str):
+            number = parse_number(value.strip())
+        if number is None:
+            return None
+        values[str(name)] = number
+
+    text = task.lower()
+    name_words = {word for name in values for word in re.findall(r"[a-z0-9]+", name.lower())}
+    if _AMBIGUOUS.intersection(re.findall(r"[a-z]+", text)) - name_words:
+        return None
+    names = {name: _name_words(name) for name in values}
+    results = _operations(text, values, names) + _aggregates(text, values, names) + _percentages(text, values, names)
+    formula = _expression(*_substitute(text, values), len(values))
+    if formula is not None:
+        results.append(formula)
+    if not results:
+        conversion = _conversion(text, list(values.values()))
+        results = [] if conversion is None else [conversion]
+    if not results:
+        return None
+    try:
+        if any(not math.isclose(result, results[0], rel_tol=1e-9, abs_tol=1e-9) for result in results):
+            return None
+        result = round(results[0], 10)
+        if float(result).is_integer():
+            result = int(result)
+    except OverflowError:
+        return None  # e.g. x ** 100 * 10 ** 100
+    if isinstance(result, float) and not math.isfinite(result):
+        return None
+    return {output_vars[0]: result}
\ No newline at end of file
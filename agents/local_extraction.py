@@ -0,0 +1,144 @@
+import re
+from itertools import permutations
+
+# escalate to the LLM below this confidence, see extract_operands()
+LOCAL_CONFIDENCE = 0.2
+# larger problems are left to the LLM rather than searching every assignment
+MAX_CANDIDATES = 8
+MAX_OUTPUTS = 5
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "hundred": 100, "thousand": 1000,
+    "half": 0.5, "dozen": 12, "twice": 2, "double": 2, "thrice": 3, "triple": 3,
+}
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "has", "have", "had", "of", "to", "in",
+    "on", "at", "for", "with", "it", "its", "he", "she", "they", "his", "her", "their", "there",
+    "that", "this", "and", "as", "by", "from", "does", "do", "did", "if", "then", "than",
+}
+# words of output names that say nothing about which number is meant
+GENERIC = {"number", "num", "of", "the", "value", "amount", "count", "quantity"}
+SYNONYMS = {
+    "each": "per", "every": "per", "costs": "price", "cost": "price", "dollar": "price",
+    "dollars": "price", "pay": "price", "paid": "price", "percent": "percentage",
+    "hours": "hour", "minutes": "minute", "days": "day", "weeks": "week", "years": "year",
+}
+
+_NUMBER = r"\$?\d[\d,]*(?:\.\d+)?(?:/\d+)?%?"
+_TOKEN = re.compile(_NUMBER + r"|[a-z]+", re.IGNORECASE)
+_CLAUSE = re.compile(r"[.;:!?,]\s|[.!?]$|\band\b|\bbut\b|\bwhile\b", re.IGNORECASE)
+
+
+def _normalize(word: str) -> str:
+    word = word.lower()
+    word = SYNONYMS.get(word, word)
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return SYNONYMS.get(word, word)
+
+
+def parse_number(token: str) -> float | None:
+    if token.lower() in NUMBER_WORDS:
+        return NUMBER_WORDS[token.lower()]
+    if not token[0].isdigit() and not token.startswith("$"):
+        return None
+    text = token.lstrip("$").rstrip("%").replace(",", "")
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/")
+            return float(numerator) / float(denominator)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _output_words(name: str) -> set[str]:
+    words = {_normalize(word) for word in re.findall(r"[a-z]+", name.lower().replace("_", " "))}
+    return (words - GENERIC) or words
+
+
+def _candidates(text: str, keep: set[str]) -> list[tuple[float, dict[str, float]]]:
+    """
+    Finds the numbers of a text with the words around them, weighted by closeness: the first word
+    after a number is usually its unit and weighs 2, the other words of the clause 1 / distance.
+    """
+    candidates = []
+    for clause in _CLAUSE.split(text):
+        tokens = []
+        for token in _TOKEN.findall(clause):
+            value = parse_number(token)
+            if value is not None:
+                tokens.append((value, token))
+            elif token.lower() not in STOPWORDS or token.lower() in keep:
+                tokens.append((None, _normalize(token)))
+        for i, (value, token) in enumerate(tokens):
+            if value is None:
+                continue
+            context: dict[str, float] = {}
+            if token.startswith("$"):
+                context["price"] = 2.0
+            if token.endswith("%"):
+                context["percentage"] = 2.0
+            words_after = 0
+            for j, (other_value, word) in enumerate(tokens):
+                if other_value is not None or j == i:
+                    continue
+                if j > i:
+                    words_after += 1
+                    weight = 2.0 if words_after == 1 else 1 / (j - i)
+                else:
+                    weight = 1 / (i - j)
+                context[word] = max(context.get(word, 0.0), weight)
+            candidates.append((value, context))
+    return candidates
+
+
+def extract_operands(text: str, output_vars: list[str]) -> tuple[dict | None, float]:
+    """
+    Extracts the value of each output variable from a question without calling an LLM.
+
+    Every number of the text (digits, money, percentages, fractions and common number words)
+    is scored against each output name by the words around it, and the assignment of distinct
+    numbers to the outputs with the highest total score is chosen.
+
+    Args:
+        text (str): The question, or the text the operands are taken from.
+        output_vars (list[str]): Names of the operands to extract, e.g. ["num_clusters", "fruits_per_cluster"].
+
+    Returns:
+        tuple[dict | None, float]:
+            - Output name to value, or None if no assignment was found.
+            - Confidence in [0, 1]: how much better the chosen assignment scores than the next best one.
+    """
+    if not output_vars or len(output_vars) > MAX_OUTPUTS:
+        return None, 0.0
+    names = [_output_words(name) for name in output_vars]
+    candidates = _candidates(text, set().union(*names))
+    if len(candidates) < len(output_vars) or len(candidates) > MAX_CANDIDATES:
+        return None, 0.0
+
+    scores = [
+        [sum(context.get(word, 0.0) for word in words) for _, context in candidates]
+        for words in names
+    ]
+    best = second = 0.0
+    best_assignment = None
+    for assignment in permutations(range(len(candidates)), len(output_vars)):
+        per_output = [scores[i][c] for i, c in enumerate(assignment)]
+        if min(per_output) <= 0:
+            continue  # every output must be supported by its context
+        total = sum(per_output)
+        if total > best:
+            best, second, best_assignment = total, best, assignment
+        elif total > second:
+            second = total
+    if best_assignment is None:
+        return None, 0.0
+
+    values = {}
+    for name, c in zip(output_vars, best_assignment):
+        value = candidates[c][0]
+        values[name] = int(value) if float(value).is_integer() else value
+    return values, 1 - second / best
\ No newline at end of file
@@ -2,6 +2,7 @@ import os
 import requests
 
 from custom_types import NodeInputVars
+from transport import get_requests_session
 
 from .base_agent import BaseAgent
 
@@ -28,6 +29,7 @@ class WebSearchAgent(BaseAgent):
             "num_results": num_results,
             "google_search_url": google_search_url,
         }
+        self.session = get_requests_session("google_search")
 
     def execute(
         self, task: str, input_vars: NodeInputVars, output_vars: list[str], params: dict
@@ -61,7 +63,7 @@ class WebSearchAgent(BaseAgent):
         }
 
         try:
-            response = requests.get(config["google_search_url"], params=params)
+            response = self.session.get(config["google_search_url"], params=params)
             response.raise_for_status()  # Raise an exception for HTTP errors
             search_results = response.json()
             return search_results["items"]
@@ -1,15 +1,27 @@
 import json
+import threading
+import weakref
+import time
 import traceback
+from typing import Callable
 
 from networkx import MultiDiGraph
 
 from agent_registry import AgentRegistry
 from custom_types import (Action, ExecuteData, InteractionData, Message,
                           SystemMessage, UserMessage, action_schema)
-from executor import Executor
+from execution_policy import CancelToken, ExecutionCancelled
+from executor import Executor, NodeExecutionError, PlanValidationError
+from llm_scheduler import LLMSlot, Priority, scheduler
+from metrics import llm_first_token_seconds
+from pipeline import PipelinedExecution
+from plan import PlanDAG
 from planner import Planner
-from prompts import *
-from utils import InteractionType, current_time, openai_client
+from prompts import (INTENT_SYSTEM_PROMPT, RESPONSE_MESSAGE_EXECUTE,
+                     RESPONSE_MESSAGE_INTERACT, RESPONSE_MESSAGE_PLAN,
+                     RESPONSE_SYSTEM_PROMPT)
+from tracing import span
+from utils import InteractionType, current_time, get_openai_client
 
 
 class Controller:
@@ -26,8 +38,14 @@ class Controller:
         executor (Executor): Handles plan execution.
         config (dict): Configuration settings for the LLM.
         client (OpenAI client): The LLM client for generating responses.
+        on_response_delta (Callable[[int, str], None] | None): When set, responses are streamed and
+            each content delta is passed to it with the ID of the message being responded to.
+        auto_execute (bool): Whether new plans are executed right away, overlapping with planning.
+
+    Execution runs on a snapshot of the latest plan, so chat messages and plan edits can be
+    handled while it runs; one execution runs at a time and `cancel_execution` stops it.
     """
-    def __init__(self):
+    def __init__(self, auto_execute: bool = False):
         """Initializes the Controller with empty logs, a planner, and an executor."""
         self.interaction_log: list[InteractionData] = []
         self.chat_history: list[Message] = []
@@ -35,14 +53,26 @@ class Controller:
         self.planner = Planner(self.registry)
         self.executor = Executor(self.registry)
         self.config = {"model": "gpt-4o-mini", "temperature": 0}
-        self.client = openai_client
+        self.on_response_delta: Callable[[int, str], None] | None = None
+        self.auto_execute = auto_execute
+        self._execution_lock = threading.Lock()
+        self._cancel_tokens: weakref.WeakSet[CancelToken] = weakref.WeakSet()  # of requested executions
+
+    @property
+    def client(self):
+        # built on the first call, so creating a session does not load the OpenAI SDK
+        return get_openai_client()
 
-    def process_user_message(self, user_message: UserMessage) -> tuple[MultiDiGraph | None, SystemMessage | None]:
+    def process_user_message(
+        self, user_message: UserMessage, cancel_token: CancelToken | None = None
+    ) -> tuple[MultiDiGraph | None, SystemMessage | None]:
         """
         Processes a user message, determines the action, and generates a system response.
 
         Args:
             user_message (UserMessage): The message sent by the user.
+            cancel_token (CancelToken | None): Cancels the execution of a new plan with auto_execute
+                (see new_cancel_token()).
 
         Returns:
             tuple[MultiDiGraph | None, SystemMessage | None]: 
@@ -50,12 +80,31 @@ class Controller:
                 - The system response message.
         """
         self.chat_history.append(user_message)
-        action = self._classify_intent()
+        with span("intent_classification"):
+            action = self._classify_intent()
         if action["action"] == 1: # plan
             if len(self.chat_history) == 1:
-                plan = self.planner.generate_plan(user_message["content"])
+                query = user_message["content"]
+            else:
+                query = action["user_query"]
+            if self.auto_execute:
+                executor = self.executor  # a reset while planning must not hand back a None plan
+                try:
+                    plan = self.plan_and_execute(query, cancel_token)
+                except (NodeExecutionError, PlanValidationError, ExecutionCancelled) as ex:
+                    if isinstance(ex, ExecutionCancelled):
+                        system_message = self._generate_response({'action': 6}, response_to=user_message["id"])
+                    elif isinstance(ex, PlanValidationError):
+                        system_message = self._plan_errors_response(ex, user_message["id"])
+                    else:
+                        system_message = self._generate_response(
+                            action={'action': 5, 'ex': f"Error: {ex}"}, response_to=user_message["id"]
+                        )
+                    self.chat_history.append(system_message)
+                    partial_plan = executor.get_plan()
+                    return (partial_plan.dag if partial_plan else None), system_message
             else:
-                plan = self.planner.generate_plan(action["user_query"])
+                plan = self.planner.generate_plan(query)
             system_message = self._generate_response(
                 action, response_to=user_message["id"], plan=plan
             )
@@ -77,6 +126,62 @@ class Controller:
         self.chat_history.append(system_message)
         return plan_dag, system_message
 
+    def plan_and_execute(self, query: str, cancel_token: CancelToken | None = None) -> PlanDAG:
+        """
+        Generates a plan and executes it, starting each node as soon as its inputs are known
+        instead of waiting for the complete plan.
+
+        Args:
+            query (str): The user's query.
+            cancel_token (CancelToken | None): Cancels the execution (see new_cancel_token()).
+
+        Returns:
+            PlanDAG: The executed plan.
+
+        Raises:
+            PlanValidationError: If the complete plan has structural errors.
+            NodeExecutionError: If a node fails once the plan is complete.
+            ExecutionCancelled: If the execution is cancelled before it starts or once the plan is complete.
+        """
+        cancel_token = self.new_cancel_token() if cancel_token is None else cancel_token
+        with self._execution_lock:
+            cancel_token.raise_if_cancelled()  # cancelled while waiting for the running execution
+            planner, executor = self.planner, self.executor  # a reset replaces both while this runs
+            executor.cancel_token = cancel_token
+            pipeline = PipelinedExecution(executor)
+            plan = planner.generate_plan(query, pipeline=pipeline)
+            with span("pipelined_execution"):
+                plan = pipeline.finish(plan)
+            planner.append_plan(plan)
+        return plan
+
+    def new_cancel_token(self) -> CancelToken:
+        """
+        Creates the cancel token of an execution when it is requested, before it waits for its
+        turn, so that cancel_execution() also stops it while it is queued.
+
+        Returns:
+            CancelToken: The token to pass to process_execution() or plan_and_execute().
+        """
+        token = CancelToken()
+        self._cancel_tokens.add(token)
+        return token
+
+    def cancel_execution(self) -> bool:
+        """
+        Cancels the running execution and every requested one that has not started yet: no further
+        node is started, agent calls in flight are abandoned and LLM calls still queued are not
+        made. The nodes that finished keep their results; queued executions are skipped.
+
+        Returns:
+            bool: Whether an execution was running.
+        """
+        running = self._execution_lock.locked()
+        for token in list(self._cancel_tokens):
+            token.cancel()
+        self.executor.cancel_token.cancel()
+        return running
+
     def process_ui_interaction(self, interaction: InteractionData, response_to: int = -1) -> tuple[MultiDiGraph | None, SystemMessage | None]:
         """
         Processes user interactions from the UI and updates the DAG accordingly.
@@ -104,6 +209,27 @@ class Controller:
                     response_to=response_to
                 )
 
+        try:
+            plan = self._apply_interaction(interaction, prev_plan)
+        except ValueError as ex:
+            return prev_plan.dag, self._generate_response(
+                action={'action': 5, 'ex': f"{ex}"},
+                response_to=response_to
+            )
+        action = {
+            "action": 4,
+            "interaction": {
+                "type": interaction["interaction"], 
+            }
+        }
+        system_response = self._generate_response(
+            action, response_to=response_to, plan=plan
+        )
+        return plan.dag, system_response
+
+    def _apply_interaction(self, interaction: InteractionData, prev_plan):
+        """Applies a UI interaction to the previous plan and returns the resulting plan."""
+        plan = None
         match interaction["interaction"]:
             case InteractionType.ADD_NODE:
                 # interaction example = {"interaction": "add_node", "n": <new node id>, "n_attr": <new node attr>, "plan": <resulting plan>}
@@ -168,24 +294,26 @@ class Controller:
                 pass
             case InteractionType.MERGE_NODES:
                 pass
-        action = {
-            "action": 4,
-            "interaction": {
-                "type": interaction["interaction"], 
-            }
-        }
-        system_response = self._generate_response(
-            action, response_to=response_to, plan=plan
-        )
-        return plan.dag, system_response
+        return plan
 
-    def process_execution(self, exec_request: ExecuteData, response_to: int = -1) -> tuple[MultiDiGraph | None, SystemMessage | None]:
+    def process_execution(
+        self, exec_request: ExecuteData, response_to: int = -1, cancel_token: CancelToken | None = None
+    ) -> tuple[MultiDiGraph | None, SystemMessage | None]:
         """
-        Executes the plan or a specific node based on the mode.
+        Executes the plan or a specific node based on the mode: "all" runs every node, "single" one
+        node whose predecessors are executed, "propagate" a node and its descendants, and "up-to"
+        a node and the ancestors it needs that are not EXECUTED or MODIFIED yet.
+
+        The execution runs on a snapshot of the latest plan. If the plan was edited meanwhile, the
+        results are carried over to the nodes of the edited plan that still compute the same thing.
+        A cancelled execution keeps the results of the nodes that finished; one cancelled before it
+        started is skipped.
 
         Args:
             exec_request (ExecuteData): The execution request details.
             response_to (int): The id of the message being responded to.
+            cancel_token (CancelToken | None): Cancels the execution, created when it was requested
+                (see new_cancel_token()); a new one by default.
 
         Returns:
             tuple[MultiDiGraph | None, SystemMessage | None]:
@@ -195,21 +323,53 @@ class Controller:
         Raises:
             Exception: If dependencies are not met or the node cannot be executed.
         """
+        cancel_token = self.new_cancel_token() if cancel_token is None else cancel_token
+        with self._execution_lock:
+            if cancel_token.cancelled:
+                print(f"[{current_time()}] -- Execution cancelled before it started")
+                return None, self._generate_response({'action': 6}, response_to=response_to)
+            planner = self.planner  # a reset while executing must not receive the results
+            executor = self.executor  # nor replace the executor this request runs on
+            start_plan = planner.get_latest_plan()
+            if not start_plan:
+                return None, self._generate_response(
+                    action={'action': 5, 'ex': "No plan to execute"},
+                    response_to=response_to
+                )
+            executor.cancel_token = cancel_token
+            executor.set_plan(start_plan.clone())
+            try:
+                plan, system_response = self._execute(executor, exec_request, response_to)
+            except ExecutionCancelled:
+                print(f"[{current_time()}] -- Execution cancelled")
+                plan = executor.get_plan()
+                system_response = self._generate_response({'action': 6}, response_to=response_to)
+            if planner is not self.planner:
+                return None, None  # the session was reset meanwhile
+            if plan is None:
+                return None, system_response
+            plan = self._commit_execution(planner, start_plan, plan)
+        return plan.dag, system_response
+
+    def _execute(self, executor: Executor, exec_request: ExecuteData, response_to: int) -> tuple[PlanDAG | None, SystemMessage | None]:
+        """Runs an execution request on the given executor's plan; see process_execution()."""
         plan = None
         system_response = None
         mode = exec_request.get("mode")
-        plan = self.planner.get_latest_plan()
-        self.executor.set_plan(plan)
 
         if mode == "all":
             try:
-                self.executor.execute_plan()
+                executor.execute_plan(exec_request.get("options"))
+            except ExecutionCancelled:
+                raise
+            except PlanValidationError as ex:
+                return None, self._plan_errors_response(ex, response_to)
             except Exception as ex:
-                return self.executor.get_plan().dag, self._generate_response(
+                return executor.get_plan(), self._generate_response(
                     action={'action': 5, 'ex': f"Error: {ex}"},
                     response_to=response_to
                 )
-            plan = self.executor.get_plan() # obtain executed plan and results
+            plan = executor.get_plan() # obtain executed plan and results
             plan.set_exec_status("EXECUTED")
             system_response = self._generate_response(
                 {"action": 3, "execute": {"mode": "all"}}, response_to=response_to, plan=plan
@@ -217,40 +377,92 @@ class Controller:
 
         elif mode == "single":
             node_id = exec_request.get("node_id")
-            if not self.executor.plan_dag and not self.executor.is_source_node(node_id):
+            if not executor.plan_dag and not executor.is_source_node(node_id):
                 return None, self._generate_response(
                     action={'action': 5, 'ex': "Cannot execute node without executing previous nodes"},
                     response_to=response_to
                 )
             
             # check if nodes corresponding to incoming edges have been executed. 
-            if not self.executor.can_execute_node(node_id):
+            if not executor.can_execute_node(node_id):
                 return None, self._generate_response(
                     action={'action': 5, 'ex': "This node cannot be executed yet because one or more of its preceding nodes have not been executed. Please make sure all prerequisite nodes are completed before proceeding."},
                     response_to=response_to
                 )
             
             try:
-                self.executor.execute_node(node_id)
+                executor.check_plan([node_id])
+            except PlanValidationError as ex:
+                return None, self._plan_errors_response(ex, response_to)
+            try:
+                executor.execute_node(node_id)
+            except ExecutionCancelled:
+                raise
             except:
-                return self.executor.get_plan().dag, self._generate_response(
+                return executor.get_plan(), self._generate_response(
                     action={'action': 5, 'ex': f"Error executing node {node_id}. Ensure edges are connected, i/o variables defined."},
                     response_to=response_to
                 )
-            plan = self.executor.get_plan()
+            plan = executor.get_plan()
             plan.set_node_exec_status(node_id, "EXECUTED")
             system_response = self._generate_response(
                 {"action": 3, "execute": {"mode": "single", "node_id": node_id}}, response_to=response_to, plan=plan
             )
 
-        self.planner.append_plan(plan)
-        return plan.dag, system_response
+        elif mode in ["propagate", "up-to"]:
+            node_id = exec_request.get("node_id")
+            if node_id not in executor.plan_dag:
+                return None, self._generate_response(
+                    action={'action': 5, 'ex': f"Node {node_id} is not in the plan"},
+                    response_to=response_to
+                )
+
+            try:
+                executor.execute_nodes(executor.nodes_to_execute(node_id, mode))
+            except ExecutionCancelled:
+                raise
+            except PlanValidationError as ex:
+                return None, self._plan_errors_response(ex, response_to)
+            except Exception as ex:
+                # keep the results of the nodes that finished before the failure
+                return executor.get_plan(), self._generate_response(
+                    action={'action': 5, 'ex': f"Error: {ex}"},
+                    response_to=response_to
+                )
+            plan = executor.get_plan()
+            system_response = self._generate_response(
+                {"action": 3, "execute": {"mode": mode, "node_id": node_id}}, response_to=response_to, plan=plan
+            )
+
+        return plan, system_response
+
+    def _plan_errors_response(self, ex: PlanValidationError, response_to: int) -> SystemMessage:
+        """Error message for a plan rejected before execution, with the structural errors attached for the UI."""
+        print(f"[{current_time()}] -- {ex}")
+        system_response = self._generate_response(action={'action': 5, 'ex': f"{ex}"}, response_to=response_to)
+        system_response["errors"] = ex.errors
+        return system_response
+
+    def _commit_execution(self, planner: Planner, start_plan: PlanDAG, executed: PlanDAG) -> PlanDAG:
+        """Adds an executed snapshot to the plan history, merged into any plan version added while it ran."""
+        latest = planner.get_latest_plan()
+        if latest is start_plan:
+            planner.append_plan(executed)
+            return executed
+        merged = latest.clone()
+        reused = merged.carry_over_results([executed])
+        print(f"[{current_time()}] -- Plan changed while executing, carried over {reused} node results")
+        planner.append_plan(merged)
+        return merged
 
     def reset(self) -> tuple[MultiDiGraph | None, SystemMessage | None, list[Message]]:
         """Resets controller state"""
+        self.cancel_execution()
         self.interaction_log.clear()
         self.chat_history.clear()
+        on_partial_plan = self.planner.on_partial_plan  # set once per connection by the server
         self.planner = Planner(self.registry)
+        self.planner.on_partial_plan = on_partial_plan
         self.executor = Executor(self.registry)
         return None, None, []
 
@@ -262,9 +474,11 @@ class Controller:
             if message["role"] in ["system", "user", "assistant"]
         ]
         try:
-            response = self.client.chat.completions.create(
-                messages=messages, **self.config, response_format={"type": "json_schema", "json_schema": action_schema}
-            )
+            with scheduler.slot(Priority.INTERACTIVE, messages, site="_classify_intent") as slot:
+                response = self.client.chat.completions.create(
+                    messages=messages, **self.config, response_format={"type": "json_schema", "json_schema": action_schema}
+                )
+                slot.record(response)
             response_obj = json.loads(response.choices[0].message.content)
             next_action = {
                 "action": response_obj["action"],
@@ -306,6 +520,10 @@ class Controller:
                     query = "Execute all steps"
                 elif action["execute"]["mode"] == "single":
                     query = f"Execute node {action['execute']['node_id']}"
+                elif action["execute"]["mode"] == "propagate":
+                    query = f"Execute node {action['execute']['node_id']} and every node after it"
+                elif action["execute"]["mode"] == "up-to":
+                    query = f"Execute the nodes needed for node {action['execute']['node_id']}, then node {action['execute']['node_id']}"
                 prompt = RESPONSE_MESSAGE_EXECUTE.format(query=query, plan=plan)
             elif action["action"] == 4:
                 # interact
@@ -320,21 +538,64 @@ class Controller:
                     "timestamp": current_time(),
                     "response_to": response_to
                 }
+            elif action["action"] == 6:
+                # execution cancelled
+                return {
+                    "role": "assistant",
+                    "content": "Execution cancelled. The results of the steps that finished are kept.",
+                    "timestamp": current_time(),
+                    "response_to": response_to
+                }
 
             messages = [
                 {"role": "system", "content": RESPONSE_SYSTEM_PROMPT},
                 {"role": "user","content": prompt},
             ]
             try:
-                response = self.client.chat.completions.create(messages=messages, **self.config)
+                with span("response_generation"), scheduler.slot(Priority.INTERACTIVE, messages, site="_generate_response") as slot:
+                    if self.on_response_delta is None:
+                        response = self.client.chat.completions.create(messages=messages, **self.config)
+                        slot.record(response)
+                        content, created = response.choices[0].message.content, response.created
+                    else:
+                        content, created = self._stream_response(messages, response_to, slot)
                 system_response = {
                     "role": "assistant",
-                    "content": response.choices[0].message.content,
-                    "timestamp": response.created,
+                    "content": content,
+                    "timestamp": created,
                     "response_to": response_to
                 }
             except Exception as e:
                 print(f"[{current_time()}] -- Error in response generation:", e, traceback.format_exc())
                 content = "The results are updated."
                 system_response = {"role": "assistant", "content": content, "timestamp": current_time(), "response_to": response_to}
-        return system_response
\ No newline at end of file
+        return system_response
+
+    def _stream_response(self, messages: list[dict], response_to: int, slot: LLMSlot) -> tuple[str, int]:
+        """
+        Streams a response completion, passing each content delta to `on_response_delta`.
+
+        Args:
+            messages (list[dict]): Chat messages of the completion request.
+            response_to (int): The message ID being responded to.
+            slot (LLMSlot): Scheduler slot the call runs in, used to record token usage.
+
+        Returns:
+            tuple[str, int]: The full response content and its creation timestamp.
+        """
+        start = time.perf_counter()
+        stream = self.client.chat.completions.create(
+            messages=messages, stream=True, stream_options={"include_usage": True}, **self.config
+        )
+        parts = []
+        created = None
+        for chunk in stream:
+            created = chunk.created
+            slot.record(chunk)  # only the last chunk carries usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:
+                    llm_first_token_seconds.observe(time.perf_counter() - start, site="_generate_response")
+                parts.append(delta)
+                self.on_response_delta(response_to, delta)
+        return "".join(parts), created
\ No newline at end of file
@@ -25,6 +25,7 @@ class SystemMessage(BaseMessage):
     id: int | None = None
     role: Literal["system", "assistant"]
     response_to: int | None  # msg id or interaction id
+    errors: list[dict] | None = None  # structural errors of a plan rejected before execution
 
 Message = Union[UserMessage, SystemMessage]
 
@@ -74,6 +75,7 @@ class UIPlan(BaseModel):
     id: str
     query: str
     timestamp: int
+    exec_options: dict = {}  # overrides of executor.DEFAULT_EXEC_OPTIONS for this plan
     nodes: list[UINode]
     edges: list[UIEdge]
 
@@ -117,8 +119,9 @@ class InteractionComm(BaseComm):
 
 # front -> back
 class ExecuteData(BaseModel):
-    mode: Literal["all", "single"]
+    mode: Literal["all", "propagate", "up-to", "single"]
     node_id: str | int | None
+    options: dict | None = None  # execution optimizations, see executor.DEFAULT_EXEC_OPTIONS
 class ExecuteComm(BaseComm):
     type: MsgType.EXECUTE
     data: ExecuteData
@@ -127,6 +130,10 @@ class ExecuteComm(BaseComm):
 class ResetComm(BaseComm):
     type: MsgType.RESET
 
+# front -> back
+class CancelComm(BaseComm):
+    type: MsgType.CANCEL
+
 # front <-> back
 class ChatDataUser(BaseModel):
     user_message: UserMessage
@@ -201,11 +208,11 @@ class LLMPlanWithMetadata(LLMPlan):
 ######################
 
 class ExecuteOption(BaseModel):
-    mode: Literal["all", "propagate", "single"]
+    mode: Literal["all", "propagate", "up-to", "single"]
     node_id: int | None = None
 
 class Action(BaseModel):
-    action: Literal[0, 1, 2, 3, 4, 5]
+    action: Literal[0, 1, 2, 3, 4, 5, 6]
     # action_category: str
     user_query: str | None = None
     plan_feedback: str | None = None
@@ -242,7 +249,7 @@ action_schema = {
                     "mode": {
                         "type": "string",
                         "description": "Execution mode",
-                        "enum": ["all", "propagate", "single"],
+                        "enum": ["all", "propagate", "up-to", "single"],
                     },
                     "node_id": {
                         "type": ["integer", "null"],
@@ -0,0 +1,45 @@
+import asyncio
+import traceback
+from typing import Awaitable, Callable
+
+from utils import current_time
+
+
+class SessionDispatcher:
+    """
+    Handles the messages of one websocket connection as tasks, so the socket keeps being read
+    while a long message, such as an execution, is handled.
+
+    Every message is assigned to a lane. A lane handles its messages one at a time, in arrival
+    order; different lanes run concurrently.
+
+    Attributes:
+        handle (Callable[[dict], Awaitable[None]]): Handles one message.
+    """
+    def __init__(self, handle: Callable[[dict], Awaitable[None]]):
+        self.handle = handle
+        self._lanes: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+    def submit(self, lane: str, message: dict) -> None:
+        """Queues a message on a lane, starting the lane on its first message."""
+        if lane not in self._lanes:
+            self._lanes[lane] = asyncio.Queue()
+            self._workers[lane] = asyncio.create_task(self._run(self._lanes[lane]))
+        self._lanes[lane].put_nowait(message)
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            message = await queue.get()
+            try:
+                await self.handle(message)
+            except Exception as e:
+                print(f"[{current_time()}] Error:", e, traceback.format_exc())
+            finally:
+                queue.task_done()
+
+    async def close(self) -> None:
+        """Stops every lane; messages still handled in worker threads run to completion on their own."""
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
\ No newline at end of file
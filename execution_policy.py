@@ -0,0 +1,286 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cache
+
+# node params consumed by the executor instead of being passed to the agent
+POLICY_PARAMS = (
+    "timeout",
+    "deadline",
+    "max_retries",
+    "backoff",
+    "hedge",
+    "hedge_percentile",
+)
+
+
+@cache
+def retryable_errors() -> tuple[type[BaseException], ...]:
+    """Transient failures worth another attempt; built on first failure to keep imports light."""
+    import openai
+    import requests
+
+    return (
+        TimeoutError,
+        ConnectionError,
+        openai.APIConnectionError,  # includes openai.APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    )
+
+
+# agent calls with a timeout or hedging run here so the executor can stop waiting for them
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="agent-call")
+# how often a call waited on under a cancel token checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.1
+
+
+class NodeTimeoutError(TimeoutError):
+    """Raised when an agent call does not finish before its timeout or deadline."""
+
+
+class ExecutionCancelled(Exception):
+    """Raised when the execution an agent call belongs to is cancelled."""
+
+
+class CancelToken:
+    """
+    Cancellation flag shared by an execution and the agent calls made for it.
+    A token with a parent is also cancelled when its parent is, e.g. a single attempt of an execution's call.
+    """
+    def __init__(self, parent: "CancelToken | None" = None):
+        self._event = threading.Event()
+        self._parent = parent
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise ExecutionCancelled("execution was cancelled")
+
+    def wait(self, seconds: float) -> bool:
+        """Sleeps up to `seconds`, returning True early if cancelled."""
+        return self._event.wait(seconds)
+
+
+# cancel token of the execution the current agent call belongs to, checked by the LLM scheduler
+current_cancel: contextvars.ContextVar[CancelToken | None] = contextvars.ContextVar(
+    "current_cancel", default=None
+)
+# time.monotonic() at which the current attempt is abandoned, so its HTTP request can give up too
+current_attempt_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "current_attempt_deadline", default=None
+)
+
+
+def attempt_timeout() -> float | None:
+    """Seconds left for the current agent call attempt, or None if it has no time limit."""
+    deadline = current_attempt_deadline.get()
+    return None if deadline is None else max(0.1, deadline - time.monotonic())
+
+
+class LatencyTracker:
+    """
+    Keeps a window of recent call latencies for one agent and model, used to decide when to hedge.
+
+    Attributes:
+        samples (deque[float]): Most recent latencies in seconds.
+        min_samples (int): Samples required before percentiles are reported.
+    """
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """Returns the p-th percentile latency, or None until enough samples are recorded."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+_trackers: dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(key: str) -> LatencyTracker:
+    """Returns the process-wide latency tracker for the given agent/model key."""
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+        return _trackers[key]
+
+
+class ExecutionPolicy:
+    """
+    Deadline, retry and hedging policy for a single agent call.
+
+    Attributes:
+        timeout (float | None): Seconds allowed for each attempt.
+        deadline (float | None): Seconds allowed for all attempts together.
+        max_retries (int): Extra attempts made after a retryable error or timeout.
+        backoff (float): Base delay in seconds; retry n sleeps uniformly in [0, backoff * 2**n].
+        max_backoff (float): Upper bound of a single retry delay.
+        hedge (bool): Whether to start a second identical call when the first is slow.
+        hedge_percentile (float): Latency percentile after which the hedged call starts.
+    """
+    def __init__(
+        self,
+        timeout: float | None = None,
+        deadline: float | None = None,
+        max_retries: int = 0,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+    ):
+        self.timeout = float(timeout) if timeout else None
+        self.deadline = float(deadline) if deadline else None
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.max_backoff = max_backoff
+        self.hedge = bool(hedge)
+        self.hedge_percentile = float(hedge_percentile)
+
+    @classmethod
+    def from_params(cls, params: dict, defaults: dict) -> tuple["ExecutionPolicy", dict]:
+        """
+        Splits node params into an execution policy and the params meant for the agent.
+
+        Args:
+            params (dict): Node params, possibly containing policy keys (see POLICY_PARAMS).
+            defaults (dict): The agent's default policy.
+
+        Returns:
+            tuple[ExecutionPolicy, dict]: The policy and the remaining agent params.
+        """
+        params = params or {}
+        policy = {**defaults, **{k: v for k, v in params.items() if k in POLICY_PARAMS}}
+        agent_params = {k: v for k, v in params.items() if k not in POLICY_PARAMS}
+        return cls(**policy), agent_params
+
+    def is_trivial(self) -> bool:
+        """True when the call can run inline, without timeout, retry or hedging."""
+        return not (self.timeout or self.deadline or self.max_retries or self.hedge)
+
+    def run(self, fn, tracker: LatencyTracker | None = None, cancel: CancelToken | None = None):
+        """
+        Calls fn() under this policy and returns its result.
+
+        Calls that exceed their timeout or are cancelled are abandoned, not interrupted: their
+        thread finishes in the background and the result is discarded. Abandoned attempts do not
+        hold a pool thread for long: their LLM call is not made if it is still waiting for a
+        scheduler slot, and the agent client's HTTP request times out with the attempt (see
+        attempt_timeout()). Retries are made here only; the agent client does not retry.
+
+        Raises:
+            NodeTimeoutError: If no attempt finished in time.
+            ExecutionCancelled: If `cancel` was cancelled before a result arrived.
+            Exception: The last error raised by fn() once retries are exhausted or the error is not retryable.
+        """
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if self.is_trivial():
+            token = current_cancel.set(cancel)
+            try:
+                return self._timed(fn, tracker)
+            finally:
+                current_cancel.reset(token)
+
+        give_up_at = time.monotonic() + self.deadline if self.deadline else None
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._attempt(fn, tracker, give_up_at, cancel)
+            except retryable_errors():
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if give_up_at and time.monotonic() + delay >= give_up_at:
+                    raise
+                if cancel is not None:
+                    if cancel.wait(delay):
+                        cancel.raise_if_cancelled()
+                else:
+                    time.sleep(delay)
+
+    def _timed(self, fn, tracker):
+        start = time.monotonic()
+        result = fn()
+        if tracker:
+            tracker.record(time.monotonic() - start)
+        return result
+
+    def _submit(self, fn, tracker, cancel, stop_at):
+        """Starts an attempt in the pool; returns its future and the token that abandons it."""
+        attempt = CancelToken(parent=cancel)
+        context = contextvars.copy_context()
+        context.run(current_cancel.set, attempt)
+        context.run(current_attempt_deadline.set, stop_at)
+        return _pool.submit(context.run, self._start_attempt, fn, tracker, attempt), attempt
+
+    def _start_attempt(self, fn, tracker, attempt: CancelToken):
+        attempt.raise_if_cancelled()  # abandoned while queued for a pool thread
+        return self._timed(fn, tracker)
+
+    def _attempt(self, fn, tracker, give_up_at, cancel=None):
+        start = time.monotonic()
+        limits = [t for t in (give_up_at, start + self.timeout if self.timeout else None) if t]
+        stop_at = min(limits) if limits else None
+        hedge_after = tracker.percentile(self.hedge_percentile) if self.hedge and tracker else None
+        hedge_at = start + hedge_after if hedge_after is not None else None
+
+        future, attempt = self._submit(fn, tracker, cancel, stop_at)
+        attempts = {future: attempt}
+        try:
+            return self._wait(attempts, start, stop_at, hedge_at, fn, tracker, cancel)
+        finally:
+            for attempt in attempts.values():
+                attempt.cancel()  # losers of a hedge, or attempts that timed out
+
+    def _wait(self, attempts, start, stop_at, hedge_at, fn, tracker, cancel):
+        pending = set(attempts)
+        error = None
+        while pending:
+            wake_at = min(t for t in (stop_at, hedge_at) if t) if stop_at or hedge_at else None
+            if cancel is not None:
+                poll_at = time.monotonic() + CANCEL_POLL_SECONDS
+                wake_at = min(wake_at, poll_at) if wake_at else poll_at
+            done, pending = wait(
+                pending,
+                timeout=None if wake_at is None else max(0, wake_at - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if cancel is not None and pending:
+                cancel.raise_if_cancelled()
+            now = time.monotonic()
+            if stop_at and now >= stop_at:
+                break
+            if hedge_at and now >= hedge_at:
+                # first call is slower than usual: race an identical one against it
+                future, attempt = self._submit(fn, tracker, cancel, stop_at)
+                attempts[future] = attempt
+                pending.add(future)
+                hedge_at = None
+        if error is not None and not pending:
+            raise error
+        raise NodeTimeoutError(f"no response after {time.monotonic() - start:.1f}s")
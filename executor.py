@@ -1,7 +1,49 @@
-import networkx as nx
+import json
+import time
 
+from networkx import descendants
+
+from agents import LLMAgent
+from execution_policy import (POLICY_PARAMS, CancelToken, ExecutionCancelled,
+                              ExecutionPolicy, NodeTimeoutError,
+                              get_latency_tracker)
+from metrics import (cache_hits_total, errors_total, llm_batched_nodes_total,
+                     llm_chain_saved_seconds, node_execution_seconds)
 from plan import PlanDAG
-from utils import openai_client
+from plan_optimizer import (find_common_subexpressions, find_llm_chains,
+                            fusion_schedule)
+from structural_validity import check_plan_structure
+from tracing import span
+from utils import current_time
+
+
+# plan execution optimizations; a plan can override them in dag.graph["exec_options"],
+# and an execute request in its "options"
+DEFAULT_EXEC_OPTIONS = {
+    "cse": True,  # run duplicate nodes once and fan the result out
+    "fuse_arithmetic": True,  # evaluate runs of arithmetic nodes inline in one pass
+    "batch_llm": False,  # send ready LLM nodes with the same model config in one call
+    "fuse_llm_chains": False,  # answer chains of single-consumer LLM nodes in one call
+}
+
+
+class NodeExecutionError(Exception):
+    """Raised when a node cannot be executed; carries the id of the failing node."""
+    def __init__(self, node_id, reason: str):
+        super().__init__(f"Error executing node {node_id}: {reason}")
+        self.node_id = node_id
+
+
+class PlanValidationError(Exception):
+    """
+    Raised before an execution starts when the plan has structural errors.
+    Carries the errors, as returned by check_plan_structure(), and the id of the first broken node.
+    """
+    def __init__(self, errors: list[dict]):
+        super().__init__("Plan cannot be executed: " + "; ".join(error["message"] for error in errors))
+        self.errors = errors
+        self.node_id = errors[0]["node"]
+
 
 class Executor:
     """
@@ -11,8 +53,8 @@ class Executor:
         agent_registry (AgentRegistry): Registry containing all available agents
         plan_dag (networkx.DiGraph): The plan represented as a directed acyclic graph
         node_info (dict): Dictionary to store node-specific information
-        model (object): The OpenAI client used for LLM interactions
         config (dict): Configuration parameters for model execution
+        cancel_token (CancelToken): Cancels the running execution and its in-flight agent calls
     """
     def __init__(self, agent_registry):
         """Initializes the Executor with the agent registry."""
@@ -20,12 +62,12 @@ class Executor:
         self.plan_dag = None 
         self.plan = None
         self.node_info = {}
-        self.model = openai_client
         self.config = {"temperature": 0, "response_format": {"type": "json_object"}}
+        self.cancel_token = CancelToken()
     
     def set_plan(self, plan):
         """Store the planDAG instance for execution."""
-        self.plan = PlanDAG(plan.query).initialize_from_dag(plan.dag)
+        self.plan = PlanDAG(plan.query).initialize_from_dag(plan.dag, order=plan.order)
         self.plan_dag = self.plan.dag
 
     def get_plan(self):
@@ -33,17 +75,459 @@ class Executor:
         self.plan.set_plan_dag(self.plan_dag)
         return self.plan
     
-    def execute_plan(self) -> dict:
-        """Execute the entire planDAG and return final results."""
-        # topological sort
-        sorted_nodes = list(nx.topological_sort(self.plan_dag)) 
+    def get_exec_options(self, overrides: dict | None = None) -> dict:
+        """Execution optimizations for the current plan: defaults, then plan options, then `overrides`."""
+        return {**DEFAULT_EXEC_OPTIONS, **self.plan_dag.graph.get("exec_options", {}), **(overrides or {})}
+
+    def execute_plan(self, options: dict | None = None) -> dict:
+        """
+        Execute the entire planDAG and return final results.
+
+        Each node is marked EXECUTED as soon as it finishes, so a failed or cancelled run keeps
+        the results of the nodes before it.
+
+        Args:
+            options (dict | None): Overrides of the execution optimizations (see DEFAULT_EXEC_OPTIONS).
+
+        Raises:
+            PlanValidationError: If the plan has structural errors; no node is executed.
+            NodeExecutionError: If a node fails.
+            ExecutionCancelled: If the execution is cancelled.
+        """
+        self.check_plan()
+        options = self.get_exec_options(options)
+        sorted_nodes = self.plan.topological_order()
+        duplicates = find_common_subexpressions(self.plan, self.agent_registry) if options["cse"] else {}
+        if options["fuse_arithmetic"]:
+            steps = fusion_schedule(self.plan, self.agent_registry, exclude=duplicates)
+        else:
+            steps = [(False, [node]) for node in sorted_nodes]
+        chains = {}
+        if options["fuse_llm_chains"]:
+            unchainable = [
+                node for node in sorted_nodes
+                if any(key in POLICY_PARAMS for key in self.plan_dag.nodes[node].get('params', {}))
+            ]
+            for chain in find_llm_chains(self.plan, self.agent_registry, exclude=[*duplicates, *unchainable]):
+                chains[chain[0]] = chain
+        chained = {node for chain in chains.values() for node in chain}
+        batch_keys = {}
+        if options["batch_llm"]:
+            batch_keys = {
+                node: key for node in sorted_nodes
+                if node not in duplicates and node not in chained and (key := self.batch_key(node))
+            }
            
-        for node in sorted_nodes:
-            # execute single node
-            self.execute_node(node)
+        done = set()
+        for fused, nodes in steps:
+            if nodes[0] in done:
+                continue  # already executed in a batch
+            self.cancel_token.raise_if_cancelled()
+            if fused:
+                self.execute_fused(nodes)
+            elif nodes[0] in duplicates:
+                self.copy_result(nodes[0], duplicates[nodes[0]])
+            elif nodes[0] in chains:
+                nodes = chains[nodes[0]]
+                self.execute_chain(nodes)
+            elif nodes[0] in batch_keys:
+                nodes = self.execute_wave(nodes[0], batch_keys, done)
+            else:
+                # execute single node
+                self.execute_node(nodes[0])
+            done.update(nodes)
+            for node in nodes:
+                self.plan.set_node_exec_status(node, "EXECUTED")
+        if duplicates:
+            cache_hits_total.inc(len(duplicates), cache="cse")
             
         return self.plan_dag.nodes[sorted_nodes[-1]]['exec']
 
+    def execute_fused(self, node_ids: list):
+        """
+        Evaluates a convex run of arithmetic nodes in one pass. The run is compiled once into
+        steps over a local value table (see _compile_fused()), values flow between its nodes
+        through the table, and inputs, exec values and edge flags are written back at the end,
+        without agent execution, policies, per-node tracing or per-node edge lookups.
+
+        From the first node that cannot be computed inline (division by zero, missing or
+        non-numeric inputs), the rest run through execute_node, which reports the error as usual.
+
+        Args:
+            node_ids (list): Nodes of the run, in topological order.
+        """
+        with span("fused_arithmetic", nodes=len(node_ids)):
+            table, loads, steps = self._compile_fused(node_ids)
+            raw = {}  # slot -> value as read from a node outside the run, written back to the inputs
+            try:
+                for slot, src, output in loads:
+                    raw[slot] = self.plan_dag.nodes[src]['exec'][output]
+                    table[slot] = float(raw[slot])
+            except (KeyError, TypeError, ValueError):
+                steps = []
+            done = 0
+            try:
+                for _, compute, operands, result, _, _ in steps:
+                    table[result] = compute([table[i] for i in operands])
+                    done += 1
+            except (ArithmeticError, IndexError):
+                pass
+            self._write_back_fused(steps[:done], table, raw)
+        for node_id in node_ids[done:]:
+            self.execute_node(node_id)
+
+    def _compile_fused(self, node_ids: list) -> tuple[list, list, list]:
+        """
+        Compiles a run of arithmetic nodes into steps over one value table, whose slots hold the
+        literal operands, the values read from nodes outside the run and the result of each node.
+        Inputs are bound as in resolve_inputs(): the last edge to an input wins.
+
+        Args:
+            node_ids (list): Nodes of the run, in topological order.
+
+        Returns:
+            tuple[list, list, list]:
+                - The table, with the literal operands filled in.
+                - Reads of values from outside the run, as (slot, source node, source output).
+                - Steps in order, as (node id, compute, operand slots, result slot,
+                  [(input index, slot)] of the bound inputs, output name). Compilation stops at the
+                  first node that cannot be compiled, e.g. with a non-numeric literal.
+        """
+        dag = self.plan_dag
+        nodes, pred = dag.nodes, dag.pred  # adjacency views, not in_edges() views built per node
+        table, loads, steps = [], [], []
+        result_slots = {}
+        external_slots = {}
+        for node_id in node_ids:
+            node = nodes[node_id]
+            bound = {
+                d['dest_input']: (src, d['src_output'])
+                for src, keyed in pred[node_id].items() for d in keyed.values()
+            }
+            operands, bound_slots = [], []
+            try:
+                for i, (name, value) in enumerate(node['input']):
+                    if name not in bound:
+                        operands.append(len(table))
+                        table.append(float(value))
+                        continue
+                    src, output = bound[name]
+                    if src in result_slots:
+                        if output != nodes[src]['output'][0]:
+                            raise ValueError(f"node {src} only computes {nodes[src]['output'][0]}")
+                        slot = result_slots[src]
+                    elif (src, output) in external_slots:
+                        slot = external_slots[(src, output)]
+                    else:
+                        slot = external_slots[(src, output)] = len(table)
+                        table.append(None)
+                        loads.append((slot, src, output))
+                    operands.append(slot)
+                    bound_slots.append((i, slot))
+                output_name = node['output'][0]
+            except (ValueError, TypeError, IndexError):
+                break
+            result_slots[node_id] = len(table)
+            table.append(None)
+            compute = self.agent_registry.get_agent(node['name']).compute
+            steps.append((node_id, compute, operands, result_slots[node_id], bound_slots, output_name))
+        return table, loads, steps
+
+    def _write_back_fused(self, steps: list, table: list, raw: dict):
+        """Stores the results of evaluated fused steps in the plan, with edge flags as update_edge_flags() sets them."""
+        dag = self.plan_dag
+        nodes, succ, pred = dag.nodes, dag.succ, dag.pred
+        original_execs = {}
+        for node_id, _, _, result, bound_slots, output_name in steps:
+            node = nodes[node_id]
+            original_execs[node_id] = node.get('exec')
+            for i, slot in bound_slots:
+                node['input'][i][1] = raw.get(slot, table[slot])
+            node['exec'] = {output_name: table[result]}
+        for node_id, original_exec in original_execs.items():
+            node_exec = nodes[node_id]['exec']
+            for dest, keyed in succ[node_id].items():
+                for (src_output, _), d in keyed.items():
+                    if original_exec:
+                        same = original_exec.get(src_output) == node_exec.get(src_output)
+                        d['sameExecVal'] = same
+                        # cleared again when the destination is executed, as below for the run
+                        d['hasUpdatedValue'] = not same and dest not in original_execs
+                    else:
+                        d['hasUpdatedValue'] = False
+            for src, keyed in pred[node_id].items():
+                if src not in original_execs:
+                    for d in keyed.values():
+                        d['hasUpdatedValue'] = False
+
+    def batch_key(self, node_id) -> str | None:
+        """
+        Returns the key shared by the nodes whose LLM calls can be sent together: LLM agent
+        nodes with the same model config. None if the node cannot be batched, e.g. because its
+        params set its own execution policy.
+        """
+        node = self.plan_dag.nodes[node_id]
+        agent = self.agent_registry.get_agent(node['name']) or self.agent_registry.get_agent("fallback")
+        params = node.get('params', {})
+        if not isinstance(agent, LLMAgent) or any(key in POLICY_PARAMS for key in params):
+            return None
+        return json.dumps({**agent.config, **params}, sort_keys=True, default=str)
+
+    def answer_locally(self, node_id, input_vars) -> bool:
+        """
+        Stores the result of an LLM agent node computed without the LLM (see LLMAgent.answer_locally()),
+        as batched and chained calls would skip that attempt.
+
+        Returns:
+            bool: Whether the node was answered locally.
+        """
+        node = self.plan_dag.nodes[node_id]
+        agent = self.agent_registry.get_agent(node['name']) or self.agent_registry.get_agent("fallback")
+        result = agent.answer_locally(node['task'], input_vars, node['output'], node.get('params', {}))
+        if result is None:
+            return False
+        self.store_result(node_id, input_vars, result)
+        return True
+
+    def store_result(self, node_id, input_vars, exec_result: dict):
+        """Stores a node's resolved inputs and exec value computed outside execute_node, and updates its edge flags."""
+        node = self.plan_dag.nodes[node_id]
+        original_exec = node.get('exec', {})
+        for pair, (_, value) in zip(node['input'], input_vars):
+            pair[1] = value
+        node['exec'] = exec_result
+        self.update_edge_flags(node_id, original_exec)
+
+    def execute_wave(self, node_id, batch_keys: dict, done: set) -> list:
+        """
+        Executes a node together with every other ready node that has the same batch key.
+
+        Args:
+            node_id (int): The node to execute.
+            batch_keys (dict): Batch key of every node that can be batched.
+            done (set): Nodes already executed in this run.
+
+        Returns:
+            list: The nodes executed.
+        """
+        key = batch_keys[node_id]
+        wave = [
+            node for node, node_key in batch_keys.items()
+            if node_key == key and node not in done
+            and all(pred in done for pred in self.plan_dag.predecessors(node))
+        ]
+        if len(wave) > 1:
+            self.execute_batch(wave)
+        else:
+            self.execute_node(node_id)
+        return wave
+
+    def execute_batch(self, node_ids: list):
+        """
+        Executes LLM agent nodes with the same model config in a single call, with the tasks keyed
+        by node id. Nodes whose agent computes the task locally are answered first and left out of
+        the call. Falls back to executing the nodes one by one if the batched call fails or its
+        response cannot be split back to every node.
+
+        Args:
+            node_ids (list): Ready nodes with the same batch key.
+        """
+        try:
+            inputs = {node_id: self.resolve_inputs(node_id) for node_id in node_ids}
+        except NodeExecutionError:
+            inputs = None  # reported by execute_node
+        if inputs is not None:
+            node_ids = [node_id for node_id in node_ids if not self.answer_locally(node_id, inputs[node_id])]
+            if not node_ids:
+                return
+            tasks = {}
+            for node_id in node_ids:
+                node = self.plan_dag.nodes[node_id]
+                agent = self.agent_registry.get_agent(node['name']) or self.agent_registry.get_agent("fallback")
+                tasks[str(node_id)] = (agent, node['task'], inputs[node_id], node['output'])
+            first = self.plan_dag.nodes[node_ids[0]]
+            params = {**tasks[str(node_ids[0])][0].config, **first.get('params', {})}
+            policy, _ = ExecutionPolicy.from_params({}, LLMAgent.exec_policy)
+            try:
+                with span("llm_batch", nodes=len(node_ids)), node_execution_seconds.time(agent="llm_batch"):
+                    results = policy.run(lambda: LLMAgent.execute_batch(tasks, params), cancel=self.cancel_token)
+            except ExecutionCancelled:
+                raise
+            except Exception as ex:
+                print(f"[{current_time()}] -- Batched LLM call for nodes {node_ids} failed, executing them one by one:", ex)
+                errors_total.inc(stage="llm_batch")
+                inputs = None
+        if inputs is None:
+            llm_batched_nodes_total.inc(len(node_ids), outcome="fallback")
+            for node_id in node_ids:
+                self.execute_node(node_id)
+            return
+
+        llm_batched_nodes_total.inc(len(node_ids), outcome="batched")
+        for node_id in node_ids:
+            self.store_result(node_id, inputs[node_id], results[str(node_id)])
+
+    def execute_chain(self, node_ids: list):
+        """
+        Executes a chain of LLM-backed nodes in a single call that returns the output of every
+        node, so each node still gets its exec value. Leading nodes whose agent computes the task
+        locally are answered first and left out of the call. Falls back to executing the nodes one
+        by one if the call fails or its response misses an output.
+
+        The latency saved is estimated from the median latency of each node's agent and model
+        when enough samples exist, and reported in the llm_chain span and metric.
+
+        Args:
+            node_ids (list): The chain, as returned by find_llm_chains().
+        """
+        while True:
+            try:
+                head_inputs = self.resolve_inputs(node_ids[0])
+            except NodeExecutionError:
+                head_inputs = None  # reported by execute_node
+                break
+            if not self.answer_locally(node_ids[0], head_inputs):
+                break
+            node_ids = node_ids[1:]
+            if not node_ids:
+                return
+        results = None
+        if head_inputs is not None:
+            steps = {}
+            for i, node_id in enumerate(node_ids):
+                node = self.plan_dag.nodes[node_id]
+                input_vars = head_inputs
+                if i > 0:
+                    bound = {
+                        d['dest_input']: f"<output '{d['src_output']}' of step {node_ids[i - 1]}>"
+                        for _, _, d in self.plan_dag.in_edges(node_id, data=True)
+                    }
+                    input_vars = [[name, bound.get(name, value)] for name, value in node['input']]
+                name = node['name'] if self.agent_registry.get_agent(node['name']) else "fallback"
+                description = f"{name}, {self.agent_registry.get_agent_description(name)}"
+                steps[str(node_id)] = (description, node['task'], input_vars, node['output'])
+            head = self.plan_dag.nodes[node_ids[0]]
+            head_agent = self.agent_registry.get_agent(head['name']) or self.agent_registry.get_agent("fallback")
+            params = {**head_agent.config, **head.get('params', {})}
+            policy, _ = ExecutionPolicy.from_params({}, head_agent.exec_policy)
+            start = time.perf_counter()
+            try:
+                with span("llm_chain", nodes=len(node_ids)) as chain_span, node_execution_seconds.time(agent="llm_chain"):
+                    results = policy.run(lambda: LLMAgent.execute_chain(steps, params), cancel=self.cancel_token)
+            except ExecutionCancelled:
+                raise
+            except Exception as ex:
+                print(f"[{current_time()}] -- Chained LLM call for nodes {node_ids} failed, executing them one by one:", ex)
+                errors_total.inc(stage="llm_chain")
+        if results is None:
+            for node_id in node_ids:
+                self.execute_node(node_id)
+            return
+
+        elapsed = time.perf_counter() - start
+        medians = [
+            get_latency_tracker(f"{self.plan_dag.nodes[node_id]['name']}:{params.get('model', '')}").percentile(50)
+            for node_id in node_ids
+        ]
+        if None not in medians:
+            saved = sum(medians) - elapsed
+            llm_chain_saved_seconds.observe(saved)
+            if chain_span is not None:
+                chain_span.attrs["saved_ms"] = round(saved * 1000, 2)
+            print(f"[{current_time()}] -- Chained {len(node_ids)} LLM nodes in one call, saving about {saved:.2f}s")
+        else:
+            print(f"[{current_time()}] -- Chained {len(node_ids)} LLM nodes in one call, saving {len(node_ids) - 1} round trips")
+
+        for node_id in node_ids:
+            self.store_result(node_id, self.resolve_inputs(node_id), results[str(node_id)])
+
+    def copy_result(self, node_id, source_id):
+        """
+        Gives a node the result of an equivalent, already executed node instead of running it.
+        Outputs are matched by position.
+        """
+        node = self.plan_dag.nodes[node_id]
+        original_exec = node.get('exec', {})
+        for pair, (_, value) in zip(node['input'], self.resolve_inputs(node_id)):
+            pair[1] = value
+
+        source = self.plan_dag.nodes[source_id]
+        result = source['exec']
+        if isinstance(result, dict):
+            result = {
+                output: result[source_output]
+                for output, source_output in zip(node['output'], source['output'])
+                if source_output in result
+            }
+        node['exec'] = result
+        self.update_edge_flags(node_id, original_exec)
+
+    def nodes_to_execute(self, node_id, mode: str) -> list:
+        """
+        Returns the nodes run by a "propagate" or "up-to" request, in execution order.
+
+        "up-to" runs the node and the ancestors it needs; "propagate" also runs every descendant
+        of the node, with the ancestors those need. Ancestors that are already EXECUTED or
+        MODIFIED are kept as they are, as are the ancestors behind them.
+
+        Args:
+            node_id (int): id of the requested node.
+            mode (str): "propagate" or "up-to".
+
+        Returns:
+            list: ids of the nodes to execute, in topological order.
+        """
+        targets = {node_id}
+        if mode == "propagate":
+            targets |= descendants(self.plan_dag, node_id)
+        needed = set(targets)
+        stack = list(targets)
+        while stack:
+            for pred in self.plan_dag.predecessors(stack.pop()):
+                if pred in needed or self.plan_dag.nodes[pred].get("exec_status") in ["EXECUTED", "MODIFIED"]:
+                    continue
+                needed.add(pred)
+                stack.append(pred)
+        return [node for node in self.plan.topological_order() if node in needed]
+
+    def check_plan(self, node_ids=None):
+        """
+        Checks the plan structure before executing it (see check_plan_structure()), so a plan
+        that would fail is rejected before any agent is called.
+
+        Args:
+            node_ids (Iterable | None): Only report errors of these nodes and of the edges into them (default: all nodes).
+
+        Raises:
+            PlanValidationError: If there are structural errors.
+        """
+        errors = [
+            problem for problem in check_plan_structure(self.plan_dag, self.agent_registry)
+            if problem["severity"] == "error"
+        ]
+        if node_ids is not None:
+            node_ids = set(node_ids)
+            # an edge fails when its destination reads it
+            errors = [
+                error for error in errors
+                if (error["edge"][1] if "edge" in error else error["node"]) in node_ids
+            ]
+        if errors:
+            errors_total.inc(stage="plan_validation")
+            raise PlanValidationError(errors)
+
+    def execute_nodes(self, node_ids: list):
+        """
+        Executes the given nodes in order, marking each EXECUTED as soon as it finishes,
+        so the nodes before a failing one keep their results.
+        Raises PlanValidationError before executing any of them if one has structural errors.
+        """
+        self.check_plan(node_ids)
+        for node_id in node_ids:
+            self.cancel_token.raise_if_cancelled()
+            self.execute_node(node_id)
+            self.plan.set_node_exec_status(node_id, "EXECUTED")
+
     def is_source_node(self, node_id):
         """Checks if the given node is a source node (has no predecessors)."""
         return len(list(self.plan_dag.predecessors(node_id))) == 0
@@ -64,38 +548,83 @@ class Executor:
         """
         Executes a single node in the plan. Stores result within node.
 
+        Agent calls follow the agent's execution policy, overridden by the policy keys in the
+        node params (timeout, deadline, max_retries, backoff, hedge, hedge_percentile).
+
         Args:
             node_id (int): id of the node to execute.
 
         Raises:
-            ValueError: If no agent is found for the specified task.
+            NodeExecutionError: If inputs cannot be resolved or the agent call fails or times out.
+            ExecutionCancelled: If the execution is cancelled.
         """
-        task = self.plan_dag.nodes[node_id]['task'] 
-        name = self.plan_dag.nodes[node_id]['name']
-        params = self.plan_dag.nodes[node_id].get('params', {})
-        original_exec = self.plan_dag.nodes[node_id].get('exec', {})
+        self.cancel_token.raise_if_cancelled()
+        node = self.plan_dag.nodes[node_id]
+        original_exec = node.get('exec', {})
+        input_vars = node['input']
+        for pair, (_, value) in zip(input_vars, self.resolve_inputs(node_id)):
+            pair[1] = value
 
-        agent = self.agent_registry.get_agent(name)
-        if not agent:
-            agent = self.agent_registry.get_agent("fallback")
-            # raise ValueError(f"No agent found for task: {task}")
+        node['exec'] = self.run_agent(node_id, node, input_vars)
+        self.update_edge_flags(node_id, original_exec)
 
-        input_vars = self.plan_dag.nodes[node_id]['input']
-        output_vars = self.plan_dag.nodes[node_id]['output']
+    def resolve_inputs(self, node_id) -> list[list]:
+        """
+        Returns the input pairs of a node with edge-bound values taken from executed predecessors.
+
+        Raises:
+            NodeExecutionError: If a predecessor has no value for the edge's source output.
+        """
         input_vals = {}
         try:
             for src_id, _, d in self.plan_dag.in_edges(node_id, data=True):
                 input_vals[d['dest_input']] = self.plan_dag.nodes[src_id]['exec'][d['src_output']]
-            for pair in input_vars:
-                pair[1] = input_vals.get(pair[0], pair[1])
+            return [[name, input_vals.get(name, value)] for name, value in self.plan_dag.nodes[node_id]['input']]
         except Exception as ex:
-            raise Exception(f"Error executing node {node_id}: Ensure edges are connected, i/o variables defined.    ")
-        
+            raise NodeExecutionError(node_id, "Ensure edges are connected, i/o variables defined.") from ex
+
+    def run_agent(self, node_id, node: dict, input_vars: list[list]) -> dict:
+        """
+        Calls the agent of a node on resolved inputs under its execution policy.
+
+        Args:
+            node_id (int): id of the node, used for errors and tracing.
+            node (dict): Node data with name, task, output and params.
+            input_vars (list[list]): Resolved input pairs.
+
+        Returns:
+            dict: The agent output keyed by output variable.
+
+        Raises:
+            NodeExecutionError: If the agent call fails or times out.
+            ExecutionCancelled: If the execution is cancelled.
+        """
+        name = node['name']
+        agent = self.agent_registry.get_agent(name)
+        if not agent:
+            agent = self.agent_registry.get_agent("fallback")
+            # raise ValueError(f"No agent found for task: {task}")
+
+        policy, agent_params = ExecutionPolicy.from_params(node.get('params', {}), agent.exec_policy)
+        tracker = get_latency_tracker(f"{name}:{agent_params.get('model', '')}")
         try:
-            self.plan_dag.nodes[node_id]['exec'] = agent.execute(task, input_vars, output_vars, params)
+            with span("node_execution", node=node_id, agent=name), node_execution_seconds.time(agent=name):
+                return policy.run(
+                    lambda: agent.execute(node['task'], input_vars, node['output'], agent_params),
+                    tracker,
+                    cancel=self.cancel_token,
+                )
+        except ExecutionCancelled:
+            raise
+        except NodeTimeoutError as ex:
+            errors_total.inc(stage="node_execution")
+            raise NodeExecutionError(node_id, f"Agent '{name}' timed out ({ex}).") from ex
         except Exception as ex:
-            raise Exception(f"Error executing node {node_id}: Ensure edges are connected, i/o variables defined.")
-        
+            errors_total.inc(stage="node_execution")
+            raise NodeExecutionError(node_id, "Ensure edges are connected, i/o variables defined.") from ex
+
+    def update_edge_flags(self, node_id, original_exec: dict):
+        """Flags the out-edges whose value changed from `original_exec` and clears the in-edge flags."""
         try:
             for _, dest_id, k, d in self.plan_dag.out_edges(node_id, data=True, keys=True):
                 if original_exec:
@@ -1,4 +1,4 @@
-import { useCallback, useEffect, useReducer, useState } from "react";
+import { useCallback, useEffect, useReducer, useRef, useState } from "react";
 import { Panel, PanelGroup, PanelResizeHandle } from "react-resizable-panels";
 import useWebSocket, { ReadyState } from "react-use-websocket";
 import { ProgressBar } from "@blueprintjs/core";
@@ -11,22 +11,40 @@ import { AppContext } from "./AppContext.jsx";
 import { chatReducer, initialChatState } from "./reducers.jsx";
 import { usePlanStore } from "./store.jsx";
 
+// the session id is kept in the URL hash, so the page URL is a link that joins the session
+const sessionFromUrl = () => new URLSearchParams(window.location.hash.slice(1)).get("session");
+
 export default function App() {
   const [sessionId, setSessionId] = useState(null);
   const [agentRegistry, setAgentRegistry] = useState(null);
 
   const [chatLoading, setChatLoading] = useState(false);
   const [planLoading, setPlanLoading] = useState(false);
+  // the request whose FINISHED status ends the loading state, not e.g. a cancel finishing first
+  const loadingAction = useRef(null);
+  const [executing, setExecuting] = useState(false);
 
   const [chat, dispatchChat] = useReducer(chatReducer, initialChatState);
   const setPlanLayout = usePlanStore((state) => state.setPlanLayout);
   const initializePlan = usePlanStore((state) => state.initializePlan);
 
-  // function to start or reset a session
+  const startPlanLoading = (action) => {
+    loadingAction.current = action;
+    setPlanLoading(true);
+  };
+
+  // function to join the session of the URL, or start a new one
   const startSession = useCallback(async () => {
+    const joined = sessionFromUrl();
+    if (joined) {
+      setSessionId(joined);
+      console.log(`[${time()}] Session joined:`, joined);
+      return;
+    }
     try {
       const response = await fetch("http://localhost:8000/start-session");
       const data = await response.json();
+      window.history.replaceState(null, "", `#session=${data.session_id}`);
       setSessionId(data.session_id);
       console.log(`[${time()}] Session started:`, data.session_id);
     } catch (error) {
@@ -56,16 +74,31 @@ export default function App() {
     getAgentRegistry();
   }, []);
 
-  // start session on mount
+  // start session on mount, and switch sessions when a link to another one is opened in this tab
   useEffect(() => {
     startSession();
+    window.addEventListener("hashchange", startSession);
+    return () => window.removeEventListener("hashchange", startSession);
   }, [startSession]);
 
   // websocket setup
   const socketUrl = sessionId ? `ws://localhost:8000/ws/${sessionId}` : null;
   const { sendJsonMessage, lastJsonMessage, readyState } = useWebSocket(
     socketUrl,
-    { shouldReconnect: () => true, reconnectAttempts: 10 }
+    {
+      shouldReconnect: () => true,
+      reconnectAttempts: 10,
+      // response deltas arrive faster than renders, so they are applied here
+      // instead of through lastJsonMessage, which would drop some of them
+      onMessage: (event) => {
+        const msg = JSON.parse(event.data);
+        if (msg.type === MsgType.CHAT_DELTA) {
+          dispatchChat({ type: "APPEND_SYSTEM_DELTA", payload: msg.data });
+          setChatLoading(false);
+        }
+      },
+      filter: (event) => JSON.parse(event.data).type !== MsgType.CHAT_DELTA,
+    }
   );
 
   // send connection status
@@ -95,18 +128,38 @@ export default function App() {
 
     switch (lastJsonMessage.type) {
       case MsgType.STATUS:
+        if (lastJsonMessage.data.action == "session" && lastJsonMessage.data.status == Status.ERROR) {
+          // the session of the link does not exist (anymore), e.g. after a server restart
+          console.log(`[${time()}] Session ${sessionId} not found, starting a new one`);
+          window.history.replaceState(null, "", window.location.pathname + window.location.search);
+          startSession();
+          break;
+        }
         if (lastJsonMessage.data.status == Status.STARTING && [MsgType.PLAN, MsgType.EXECUTE].includes(lastJsonMessage.data.action)) {
-          setPlanLoading(true);
+          startPlanLoading(lastJsonMessage.data.action);
         }
-        if (lastJsonMessage.data.status == Status.FINISHED) {
+        if (lastJsonMessage.data.status == Status.FINISHED && lastJsonMessage.data.action == loadingAction.current) {
+          loadingAction.current = null;
           setPlanLoading(false);
         }
+        if (lastJsonMessage.data.action == MsgType.EXECUTE && [Status.FINISHED, Status.ERROR].includes(lastJsonMessage.data.status)) {
+          setExecuting(false);
+        }
         console.log(
           `[${time()}] -- ${lastJsonMessage.data.action}:`,
           lastJsonMessage.data.status
         );
         break;
       case MsgType.CHAT:
+        // messages sent from another tab of the session, and the chat so far when joining it
+        if (lastJsonMessage.data.user_message) {
+          dispatchChat({ type: "ADD_USER_MESSAGE", payload: lastJsonMessage.data.user_message });
+          break;
+        }
+        if (!lastJsonMessage.data.system_response) {
+          dispatchChat({ type: "SET_CHAT_HISTORY", payload: lastJsonMessage.data.chat_history });
+          break;
+        }
         // setMessages(lastJsonMessage.data.chat_history);
         // setMessages([lastJsonMessage.data.system_response]);
         // addMessage(lastJsonMessage.data.system_response);
@@ -123,9 +176,15 @@ export default function App() {
         break;
       case MsgType.PLAN:
         setPlanLayout(lastJsonMessage.data.plan);
-        setPlanLoading(false);
+        // partial plans arrive while the planner is still generating
+        setPlanLoading(Boolean(lastJsonMessage.data.partial));
         console.log(`[${time()}] Plan updated:`, lastJsonMessage.data.plan);
         break;
+      case MsgType.RESET:
+        // the session was reset, possibly from another tab
+        dispatchChat({ type: "CLEAR_CHAT" });
+        initializePlan();
+        break;
       default:
         console.log(`[${time()}] Msg received:`, lastJsonMessage);
     }
@@ -142,7 +201,7 @@ export default function App() {
     dispatchChat({ type: "ADD_USER_MESSAGE", payload: msg });
 
     setChatLoading(true);
-    setPlanLoading(true);
+    startPlanLoading(MsgType.CHAT);
     sendJsonMessage({ type: MsgType.CHAT, data: msg });
   };
 
@@ -153,13 +212,15 @@ export default function App() {
     setPlanLoading(true);
     sendJsonMessage({ type: MsgType.RESET, data: {} });
     initializePlan();
+    loadingAction.current = null;
     setPlanLoading(false);
   };
 
   // plan view buttons
   const requestExecute = async (mode, node_id = null) => {
     console.log(`[${time()}] Execution requested:`, mode, node_id);
-    setPlanLoading(true);
+    startPlanLoading(MsgType.EXECUTE);
+    setExecuting(true);
     // temporary
     // const { nodes, edges } = usePlanStore.getState();
     // sendJsonMessage({ type: MsgType.PLAN, data: { nodes, edges } });
@@ -170,10 +231,20 @@ export default function App() {
     });
   };
 
+  const shareSession = async () => {
+    await navigator.clipboard.writeText(window.location.href);
+    console.log(`[${time()}] Session link copied:`, window.location.href);
+  };
+
+  const requestCancel = async () => {
+    console.log(`[${time()}] Cancel requested`);
+    sendJsonMessage({ type: MsgType.CANCEL, data: {} });
+  };
+
   const requestFixPlan = async () => {
     console.log(`[${time()}] Plan fix requested`);
     const { id, query, timestamp, nodes, edges } = usePlanStore.getState();
-    setPlanLoading(true);
+    startPlanLoading(MsgType.INTERACTION);
     sendJsonMessage({
       type: MsgType.INTERACTION,
       data: { interaction: InteractionType.FIX_PLAN, plan: { id, query, timestamp, nodes, edges } },
@@ -182,7 +253,7 @@ export default function App() {
 
   const requestRePlan = async () => {
     console.log(`[${time()}] Re-plan requested`);
-    setPlanLoading(true);
+    startPlanLoading(MsgType.INTERACTION);
     sendJsonMessage({
       type: MsgType.INTERACTION,
       data: { interaction: InteractionType.REPLAN },
@@ -212,6 +283,8 @@ export default function App() {
         rePlan: requestRePlan,
         fixPlan: requestFixPlan,
         executeNode: requestExecute,
+        cancelExecution: requestCancel,
+        executing: executing,
         sendInteraction: sendInteraction,
         sendPlan: sendPlan,
         agentRegistry: agentRegistry,
@@ -224,6 +297,8 @@ export default function App() {
             isLoading={chatLoading}
             clearChat={requestReset}
             sendMessage={sendMessage}
+            sessionId={sessionId}
+            shareSession={shareSession}
           />
         </Panel>
         <PanelResizeHandle className="panelHandle" />
@@ -3,7 +3,7 @@ import { Button, NonIdealState, TextArea, Tooltip } from "@blueprintjs/core";
 
 import MessageList from "./MessageList";
 
-export default function Chat({ clearChat, sendMessage, messages, isLoading }) {
+export default function Chat({ clearChat, sendMessage, messages, isLoading, sessionId, shareSession }) {
   const [message, setMessage] = useState("");
   const messageListContainer = useRef(null);
 
@@ -69,6 +69,9 @@ export default function Chat({ clearChat, sendMessage, messages, isLoading }) {
           disabled={!message || isLoading}
           onClick={handleSend}
         />
+        <Tooltip content={`Session ${sessionId ?? "..."}: copy a link that opens it in another tab`} placement="top-end">
+          <Button icon="share" disabled={!sessionId} onClick={shareSession} style={{ height: "100%" }} />
+        </Tooltip>
       </div>
     </>
   );
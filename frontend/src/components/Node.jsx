@@ -35,9 +35,9 @@ function BaseNode(props) {
   const edges = useEdges();
   const { executeNode, sendPlan } = useContext(AppContext);
 
-  const onExecuteNode = () => {
+  const onExecuteNode = (mode = "single") => {
     sendPlan(nodes, edges);
-    executeNode("single", parseInt(props.id));
+    executeNode(mode, parseInt(props.id));
   };
 
   return (
@@ -58,15 +58,33 @@ function BaseNode(props) {
           <>
             {props.type == "_task" && props.status}
             {props.type !== "_output" && (
-              <Tooltip content="Execute this node" placement="top">
-                <Button
-                  className="bp5-tiny"
-                  icon="play"
-                  intent={props.type == "_query" ? "primary" : "success"}
-                  onClick={onExecuteNode}
-                  disabled={props.type == "_query"}
-                />
-              </Tooltip>
+              <>
+                <Tooltip content="Execute the steps this node needs, then this node" placement="top">
+                  <Button
+                    className="bp5-tiny"
+                    icon="step-forward"
+                    onClick={() => onExecuteNode("up-to")}
+                    disabled={props.type == "_query"}
+                  />
+                </Tooltip>
+                <Tooltip content="Execute this node" placement="top">
+                  <Button
+                    className="bp5-tiny"
+                    icon="play"
+                    intent={props.type == "_query" ? "primary" : "success"}
+                    onClick={() => onExecuteNode("single")}
+                    disabled={props.type == "_query"}
+                  />
+                </Tooltip>
+                <Tooltip content="Execute this node and every node after it" placement="top">
+                  <Button
+                    className="bp5-tiny"
+                    icon="fast-forward"
+                    onClick={() => onExecuteNode("propagate")}
+                    disabled={props.type == "_query"}
+                  />
+                </Tooltip>
+              </>
             )}
           </>
         }
@@ -59,7 +59,7 @@ function PlanGraph() {
     addEdge,
     removeEdge,
   } = usePlanStore(useShallow(selector));
-  const { agentRegistry, rePlan, fixPlan, executeNode, sendInteraction, sendPlan } =
+  const { agentRegistry, rePlan, fixPlan, executeNode, cancelExecution, executing, sendInteraction, sendPlan } =
     useContext(AppContext);
   const nodesInitialized = useNodesInitialized();
   const { fitView } = useReactFlow();
@@ -199,9 +199,15 @@ function PlanGraph() {
           <Tooltip content="Fix/complete plan with LLM" placement="bottom">
             <Button icon="build" intent="primary" text="Help!" onClick={fixPlan} />
           </Tooltip>
-          <Tooltip content="Execute entire plan" placement="bottom-end">
-            <Button icon="play" intent="success" text="Execute" onClick={onExecuteAll} />
-          </Tooltip>
+          {executing ? (
+            <Tooltip content="Stop the running execution, keeping finished results" placement="bottom-end">
+              <Button icon="stop" intent="danger" text="Cancel" onClick={cancelExecution} />
+            </Tooltip>
+          ) : (
+            <Tooltip content="Execute entire plan" placement="bottom-end">
+              <Button icon="play" intent="success" text="Execute" onClick={onExecuteAll} />
+            </Tooltip>
+          )}
         </div>
         <div className="cols-wrapper" style={{ float: "right" }}>
           <Tooltip content="Add a node placeholder" placement="bottom-end">
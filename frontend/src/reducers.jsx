@@ -15,12 +15,40 @@ export const chatReducer = (state, action) => {
         ],
         nextId: state.nextId + 1,
       };
-    case "ADD_SYSTEM_RESPONSE":
+    case "APPEND_SYSTEM_DELTA": {
+      // grow the response being streamed, or start it on the first delta
+      const { response_to, delta } = action.payload;
+      const last = state.messages.at(-1);
+      if (last && last.streaming && last.response_to === response_to) {
+        return {
+          ...state,
+          messages: [...state.messages.slice(0, -1), { ...last, content: last.content + delta }],
+        };
+      }
+      return {
+        ...state,
+        messages: [
+          ...state.messages,
+          { role: "assistant", content: delta, response_to, streaming: true, id: state.nextId },
+        ],
+        nextId: state.nextId + 1,
+      };
+    }
+    case "ADD_SYSTEM_RESPONSE": {
+      // the final response replaces its streamed draft
+      const last = state.messages.at(-1);
+      if (last && last.streaming && last.response_to === action.payload.response_to) {
+        return {
+          ...state,
+          messages: [...state.messages.slice(0, -1), { ...action.payload, id: last.id }],
+        };
+      }
       return {
         ...state,
         messages: [...state.messages, { ...action.payload, id: state.nextId }],
         nextId: state.nextId + 1,
       };
+    }
     case "CLEAR_CHAT":
       return { ...initialChatState };
     case "SET_CHAT_HISTORY": {
@@ -0,0 +1,221 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from execution_policy import ExecutionCancelled, current_cancel
+from metrics import (CallbackMetric, errors_total, llm_call_seconds,
+                     llm_calls_total, llm_queue_seconds, llm_tokens_total)
+
+# session on whose behalf LLM calls are made; set by the server around each message
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_session", default="default"
+)
+
+
+class Priority:
+    """Priority classes of LLM calls, lower runs first."""
+    INTERACTIVE = 0  # intent classification and chat responses
+    PLANNING = 1  # plan generation, refinement and fixing
+    BULK = 2  # node execution
+
+    NAMES = {INTERACTIVE: "interactive", PLANNING: "planning", BULK: "bulk"}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+    A request larger than the bucket is admitted once the bucket is full, leaving it in debt.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens can be taken, 0 if they can be taken now."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self) -> None:
+        """Empties the bucket, e.g. after the upstream reported a rate limit."""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+class LLMScheduler:
+    """
+    Admission control in front of every LLM call made by this process.
+
+    Calls wait in a queue ordered by priority class, then by weighted fair queuing across
+    sessions, and are admitted when the request-per-minute and token-per-minute buckets
+    and the concurrency limit allow it.
+
+    Attributes:
+        requests (TokenBucket): Requests-per-minute budget.
+        tokens (TokenBucket): Tokens-per-minute budget.
+        max_concurrency (int): Maximum number of calls in flight.
+        weights (dict[str, float]): Fair-share weight per session (default 1).
+    """
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.weights: dict[str, float] = {}
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._queue: list[tuple] = []  # (priority, finish tag, seq, session)
+        self._seq = itertools.count()
+        self._virtual_time = {p: 0.0 for p in Priority.NAMES}
+        self._last_finish: dict[tuple[int, str], float] = {}
+
+    def acquire(self, priority: int, session: str, est_tokens: int) -> None:
+        """Blocks until the call may start."""
+        with self._cond:
+            weight = self.weights.get(session, 1.0)
+            start = max(self._virtual_time[priority], self._last_finish.get((priority, session), 0.0))
+            finish = start + est_tokens / weight
+            self._last_finish[(priority, session)] = finish
+            entry = (priority, finish, next(self._seq), session)
+            heapq.heappush(self._queue, entry)
+            while True:
+                if self._queue[0] is entry and self.in_flight < self.max_concurrency:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+                    if wait == 0:
+                        break
+                else:
+                    wait = None
+                self._cond.wait(timeout=wait)
+            heapq.heappop(self._queue)
+            self._virtual_time[priority] = finish
+            if len(self._last_finish) > 1024:
+                # sessions that fell behind the virtual clock start from it again anyway
+                self._last_finish = {
+                    key: tag for key, tag in self._last_finish.items()
+                    if tag > self._virtual_time[key[0]]
+                }
+            self.requests.take(1)
+            self.tokens.take(est_tokens)
+            self.in_flight += 1
+            self._cond.notify_all()
+
+    def release(self, est_tokens: int, used_tokens: int | None, rate_limited: bool = False) -> None:
+        """Marks a call finished and corrects the token budget with the actual usage."""
+        with self._cond:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.take(used_tokens - est_tokens)
+            if rate_limited:
+                self.requests.drain()
+                self.tokens.drain()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int, messages: list[dict], site: str, max_output_tokens: int = 512):
+        """
+        Holds an admission slot for one LLM call made inside the `with` block.
+
+        Args:
+            priority (int): A Priority class.
+            messages (list[dict]): Chat messages of the call, used to estimate its token cost.
+            site (str): Name of the call site, used as the metrics label.
+            max_output_tokens (int): Expected completion size, added to the estimate.
+
+        Yields:
+            LLMSlot: Call `record(response)` on it so the actual token usage is accounted.
+        """
+        est_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4 + max_output_tokens
+        session = current_session.get()
+        queued_at = time.perf_counter()
+        self.acquire(priority, session, est_tokens)
+        cancel = current_cancel.get()
+        if cancel is not None and cancel.cancelled:
+            # the execution was cancelled while this call was queued
+            self.release(est_tokens, 0)
+            raise ExecutionCancelled("execution was cancelled before the LLM call started")
+        started_at = time.perf_counter()
+        llm_queue_seconds.observe(started_at - queued_at, priority=Priority.NAMES[priority])
+        slot = LLMSlot(site)
+        rate_limited = False
+        try:
+            yield slot
+        except Exception as ex:
+            from openai import RateLimitError  # already loaded by the failed call
+
+            rate_limited = isinstance(ex, RateLimitError)
+            errors_total.inc(stage=site)
+            raise
+        finally:
+            self.release(est_tokens, slot.used_tokens, rate_limited)
+            llm_call_seconds.observe(time.perf_counter() - started_at, site=site)
+            llm_calls_total.inc(site=site)
+
+    def get_stats(self) -> dict:
+        """Returns queue depths per priority class and per session, and calls in flight."""
+        with self._cond:
+            by_priority = {name: 0 for name in Priority.NAMES.values()}
+            by_session: dict[str, int] = {}
+            for priority, _, _, session in self._queue:
+                by_priority[Priority.NAMES[priority]] += 1
+                by_session[session] = by_session.get(session, 0) + 1
+            return {
+                "in_flight": self.in_flight,
+                "queued": by_priority,
+                "queued_by_session": by_session,
+            }
+
+
+class LLMSlot:
+    """Admission slot handed out by LLMScheduler.slot()."""
+    def __init__(self, site: str):
+        self.site = site
+        self.used_tokens = None
+
+    def record(self, response) -> None:
+        """Records the token usage reported in an OpenAI response."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.used_tokens = usage.total_tokens
+            llm_tokens_total.inc(usage.prompt_tokens, site=self.site, kind="prompt")
+            llm_tokens_total.inc(usage.completion_tokens, site=self.site, kind="completion")
+
+
+scheduler = LLMScheduler(
+    rpm=float(os.environ.get("AIPOM_LLM_RPM", 500)),
+    tpm=float(os.environ.get("AIPOM_LLM_TPM", 150000)),
+    max_concurrency=int(os.environ.get("AIPOM_LLM_CONCURRENCY", 16)),
+)
+
+CallbackMetric(
+    "aipom_llm_queue_depth",
+    "LLM calls waiting for a scheduler slot",
+    ("priority",),
+    collect=lambda: {(name,): n for name, n in scheduler.get_stats()["queued"].items()},
+)
+CallbackMetric(
+    "aipom_llm_in_flight", "LLM calls in flight", collect=lambda: {(): scheduler.in_flight}
+)
+
+
+@contextmanager
+def session_scope(session_id: str):
+    """Attributes the LLM calls made inside the block to a session."""
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets in seconds, from local arithmetic nodes up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """Base class of a metric family with a fixed set of label names."""
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class CallbackMetric(Metric):
+    """
+    Gauge or counter read at scrape time from a callback returning {label values tuple: value},
+    for state that is already tracked elsewhere (scheduler queues, connection pools).
+    """
+    def __init__(self, name, help, labelnames=(), collect=None, kind="gauge"):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {v}"
+            for k, v in self.collect().items()
+            if v is not None
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.values: dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            if key not in self.values:
+                self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            entry = self.values[key]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time spent in the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self.values.items()]
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+registry: list[Metric] = []
+
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+def merge_shards(texts: dict[str, str]) -> str:
+    """
+    Merges the /metrics output of several shards into one exposition,
+    adding a `shard` label to every sample.
+    """
+    families: dict[str, list[str]] = {}
+    for shard, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split()[2]
+                families.setdefault(family, [])
+                if line not in families[family]:
+                    families[family].append(line)
+            elif line and family:
+                name, _, rest = line.rpartition(" ")
+                if "{" in name:
+                    name = name.replace("{", f'{{shard="{shard}",', 1)
+                else:
+                    name = f'{name}{{shard="{shard}"}}'
+                families[family].append(f"{name} {rest}")
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
+
+
+ws_message_seconds = Histogram(
+    "aipom_ws_message_seconds", "Time to handle a websocket message", ("msg_type",)
+)
+ws_outbound_dropped_total = Counter(
+    "aipom_ws_outbound_dropped_total",
+    "Outgoing websocket messages superseded or merged before being sent, or dropped on overflow",
+    ("msg_type",),
+)
+llm_call_seconds = Histogram(
+    "aipom_llm_call_seconds", "Latency of LLM calls, excluding scheduler queueing", ("site",)
+)
+llm_first_token_seconds = Histogram(
+    "aipom_llm_first_token_seconds", "Time to the first content token of streamed LLM calls", ("site",)
+)
+llm_queue_seconds = Histogram(
+    "aipom_llm_queue_seconds", "Time LLM calls waited for a scheduler slot", ("priority",)
+)
+node_execution_seconds = Histogram(
+    "aipom_node_execution_seconds", "Time to execute a plan node", ("agent",)
+)
+llm_tokens_total = Counter(
+    "aipom_llm_tokens_total", "Tokens used by LLM calls", ("site", "kind")
+)
+llm_calls_total = Counter("aipom_llm_calls_total", "LLM calls made", ("site",))
+errors_total = Counter("aipom_errors_total", "Errors by stage", ("stage",))
+cache_hits_total = Counter(
+    "aipom_cache_hits_total", "Work skipped because a result could be reused", ("cache",)
+)
+llm_batched_nodes_total = Counter(
+    "aipom_llm_batched_nodes_total", "Nodes sent in a batched LLM call", ("outcome",)
+)
+local_fast_path_total = Counter(
+    "aipom_local_fast_path_total", "LLM tasks tried locally first, by whether the local result was used", ("site", "outcome")
+)
+model_cascade_total = Counter(
+    "aipom_model_cascade_total", "Cascaded LLM calls by whether the first model's answer was used", ("site", "outcome")
+)
+llm_chain_saved_seconds = Histogram(
+    "aipom_llm_chain_saved_seconds",
+    "Estimated latency saved by answering a chain of LLM nodes in one call, from the nodes' median latencies",
+)
@@ -0,0 +1,64 @@
+import os
+from typing import Callable, TypeVar
+
+from metrics import model_cascade_total
+from utils import current_time
+
+T = TypeVar("T")
+
+# cheaper models tried, in order, before the configured one; "cascade" in agent params or the
+# planner config overrides it, and an empty list always uses the configured model
+DEFAULT_CASCADE = [
+    model for model in os.environ.get("AIPOM_MODEL_CASCADE", "gpt-4o-mini").split(",") if model
+]
+
+
+def cascade_models(model: str, cascade: list[str] | None = None) -> list[str]:
+    """
+    Returns the models to try in order: the cascade, then the configured model.
+
+    Args:
+        model (str): The configured model, always tried last.
+        cascade (list[str] | None): Cheaper models to try first (default: DEFAULT_CASCADE).
+
+    Returns:
+        list[str]: Distinct models in the order they are tried.
+    """
+    cascade = DEFAULT_CASCADE if cascade is None else cascade
+    return [m for m in cascade if m != model] + [model]
+
+
+def run_cascade(call: Callable[[str], T], validate: Callable[[T], None], models: list[str], site: str) -> T:
+    """
+    Calls the models in order until an answer passes the local checks.
+
+    Answers of every model but the last are checked by `validate`; an answer that fails, or a
+    ValueError raised by `call` itself (e.g. a response that is not JSON), escalates to the next
+    model. The answer of the last model is returned as is, unless `call` raises. Outcomes are
+    counted per call site in `aipom_model_cascade_total`, to tune the cascade.
+
+    Args:
+        call (Callable[[str], T]): Makes the call with the given model and parses the response.
+        validate (Callable[[T], None]): Raises ValueError if an answer must not be used.
+        models (list[str]): Models to try, as returned by cascade_models().
+        site (str): Call site reported in the metrics, e.g. "_llm_planner".
+
+    Returns:
+        T: The first accepted answer.
+
+    Raises:
+        ValueError: If the last model's response cannot be parsed.
+    """
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        try:
+            result = call(model)
+            if not last:
+                validate(result)
+        except ValueError as ex:
+            if last:
+                raise
+            print(f"[{current_time()}] -- {site}: answer of {model} rejected, escalating to {models[i + 1]}:", ex)
+            continue
+        model_cascade_total.inc(site=site, outcome="first" if i == 0 else "escalated")
+        return result
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+from collections import deque
+
+from fastapi import WebSocket
+
+from metrics import ws_outbound_dropped_total
+from utils import MsgType, current_time
+
+# limits of the messages waiting to be sent on one connection
+MAX_PENDING_BYTES = int(os.environ.get("AIPOM_WS_MAX_PENDING_BYTES", 8 * 1024 * 1024))
+MAX_PENDING_MESSAGES = int(os.environ.get("AIPOM_WS_MAX_PENDING_MESSAGES", 1000))
+
+
+def encode(message: dict) -> str:
+    """Encodes a message the way WebSocket.send_json does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class OutboundQueue:
+    """
+    Outgoing messages of one websocket connection, sent in order by a single writer task.
+
+    Messages are encoded once, when they are queued. While a message waits, newer messages
+    can make it stale:
+    - a PLAN message replaces every plan still waiting, since only the newest plan matters;
+    - consecutive CHAT_DELTA messages of the same response are merged into one.
+    Chat and status messages are never dropped, and keep their order with the rest.
+
+    If the client still falls behind by more than `max_bytes` or `max_messages`, the
+    connection is closed instead of buffering more; the client reconnects and resyncs.
+
+    Attributes:
+        websocket (WebSocket): The connection the messages are sent on.
+        max_bytes (int): Limit of the encoded size of the waiting messages.
+        max_messages (int): Limit of the number of waiting messages.
+        closed (bool): Whether the queue stopped sending, after an overflow or a send error.
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_bytes: int = MAX_PENDING_BYTES,
+        max_messages: int = MAX_PENDING_MESSAGES,
+    ):
+        self.websocket = websocket
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.closed = False
+        self._pending: deque[dict] = deque()  # {"type", "data", "text"}
+        self._bytes = 0
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._run())
+
+    def send(self, message: dict, text: str | None = None) -> None:
+        """
+        Queues a message without waiting; must be called on the event loop.
+
+        Args:
+            message (dict): Message with "type" and "data".
+            text (str | None): The message already encoded, e.g. once for all the subscribers of a session.
+        """
+        if self.closed:
+            return
+        msg_type = message.get("type")
+        last = self._pending[-1] if self._pending else None
+        if (
+            msg_type == MsgType.CHAT_DELTA and last is not None and last["type"] == MsgType.CHAT_DELTA
+            and last["data"]["response_to"] == message["data"]["response_to"]
+        ):
+            data = {**last["data"], "delta": last["data"]["delta"] + message["data"]["delta"]}
+            self._remove(last)
+            ws_outbound_dropped_total.inc(msg_type=msg_type)
+            message = {**message, "data": data}
+            text = None
+        elif msg_type == MsgType.PLAN:
+            for stale in [entry for entry in self._pending if entry["type"] == MsgType.PLAN]:
+                self._remove(stale)
+                ws_outbound_dropped_total.inc(msg_type=msg_type)
+
+        entry = {"type": msg_type, "data": message.get("data"), "text": text or encode(message)}
+        self._pending.append(entry)
+        self._bytes += len(entry["text"])
+        self._ready.set()
+        if self._bytes > self.max_bytes or len(self._pending) > self.max_messages:
+            print(
+                f"[{current_time()}] -- Client is too slow ({len(self._pending)} messages, "
+                f"{self._bytes} bytes waiting), closing the connection"
+            )
+            ws_outbound_dropped_total.inc(len(self._pending), msg_type="overflow")
+            self._close(code=1013)  # try again later
+
+    def _remove(self, entry: dict) -> None:
+        self._pending.remove(entry)
+        self._bytes -= len(entry["text"])
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            while self._pending:
+                entry = self._pending.popleft()
+                self._bytes -= len(entry["text"])
+                try:
+                    await self.websocket.send_text(entry["text"])
+                except Exception:
+                    self._close()  # the receive loop handles the disconnect
+                    return
+            self._ready.clear()
+
+    def _close(self, code: int | None = None) -> None:
+        self.closed = True
+        self._pending.clear()
+        self._bytes = 0
+        if code is not None:
+            asyncio.create_task(self._close_websocket(code))
+
+    async def _close_websocket(self, code: int) -> None:
+        self._writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # already closing
+
+    async def close(self) -> None:
+        """Stops the writer; messages not sent yet are discarded."""
+        self.closed = True
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+
+
+class SessionChannel:
+    """
+    The websocket connections subscribed to one session, e.g. several browser tabs or reviewers.
+
+    Broadcast messages are encoded once and the same text is queued for every subscriber; each
+    subscriber has its own OutboundQueue, so a slow one is coalesced or disconnected without
+    holding back the others.
+
+    Attributes:
+        subscribers (set[OutboundQueue]): Outbound queues of the connected subscribers.
+    """
+    def __init__(self):
+        self.subscribers: set[OutboundQueue] = set()
+
+    def subscribe(self, outbound: OutboundQueue) -> None:
+        self.subscribers.add(outbound)
+
+    def unsubscribe(self, outbound: OutboundQueue) -> None:
+        self.subscribers.discard(outbound)
+
+    def send(self, message: dict, exclude: OutboundQueue | None = None) -> None:
+        """Queues a message for every subscriber but `exclude`; must be called on the event loop."""
+        text = encode(message)
+        for outbound in list(self.subscribers):
+            if outbound is exclude:
+                continue
+            if outbound.closed:
+                self.subscribers.discard(outbound)  # lagged behind and was disconnected
+            else:
+                outbound.send(message, text)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from executor import Executor, NodeExecutionError
+from plan import PlanDAG
+from utils import current_time
+
+
+class PipelinedExecution:
+    """
+    Executes plan nodes while the planner is still streaming the plan.
+
+    Nodes and edges are added as the planner parses them. A node starts as soon as each of its
+    inputs has a value: a literal from the plan, or the output of an executed node once the edge
+    binding it has arrived. Nodes are first parsed without their edges, so a node that ran on a
+    literal is run again when an edge to that input arrives later. When the plan is complete,
+    `finish` keeps every result whose inputs still match and executes the rest in order.
+
+    Attributes:
+        executor (Executor): Executor whose agents and execution policies are used.
+        nodes (dict[int, dict]): Nodes received so far, with agent names and params as in the final plan.
+        edges (list[dict]): Edges received so far.
+        results (dict[int, tuple[list[list], dict]]): Inputs used and output of each finished run.
+    """
+    def __init__(self, executor: Executor, max_workers: int = 8):
+        self.executor = executor
+        self.nodes: dict[int, dict] = {}
+        self.edges: list[dict] = []
+        self.results: dict[int, tuple[list[list], dict]] = {}
+        self._running: dict[int, list[list]] = {}  # node id -> inputs of the run in flight
+        self._futures: list[Future] = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._agent_names = executor.agent_registry.get_agents_names()
+
+    def add(self, kind: str, element: dict) -> None:
+        """
+        Adds a node or an edge parsed from the planner stream and starts what became runnable.
+
+        Args:
+            kind (str): "nodes" or "edges", as returned by IncrementalPlanParser.feed().
+            element (dict): The parsed Node or Edge.
+        """
+        with self._lock:
+            if kind == "nodes":
+                name = element["name"] if element["name"] in self._agent_names else "fallback"
+                self.nodes[element["id"]] = {
+                    **element,
+                    "name": name,
+                    "params": self.executor.agent_registry.get_agent_default_config(name),
+                }
+                self._start_if_ready(element["id"])
+            else:
+                self.edges.append(element)
+                self._start_if_ready(element["dest_node"])
+
+    def _bound_inputs(self, node_id) -> list[list] | None:
+        """Input pairs of a node with every value known so far, or None if one is still missing."""
+        inputs = []
+        for name, value in self.nodes[node_id]["input"]:
+            sources = [
+                e for e in self.edges if e["dest_node"] == node_id and e["dest_input"] == name
+            ]
+            if sources:
+                edge = sources[-1]  # like the executor, the last edge to an input wins
+                result = self.results.get(edge["src_node"])
+                if result is None or edge["src_output"] not in result[1]:
+                    return None
+                value = result[1][edge["src_output"]]
+            elif value is None:
+                return None
+            inputs.append([name, value])
+        return inputs
+
+    def _start_if_ready(self, node_id) -> None:
+        if node_id not in self.nodes or node_id in self._running:
+            return  # a changed input is picked up when the run in flight completes
+        inputs = self._bound_inputs(node_id)
+        if inputs is None or (node_id in self.results and self.results[node_id][0] == inputs):
+            return
+        self._running[node_id] = inputs
+        context = contextvars.copy_context()  # keeps the session and trace of the request
+        future = self._pool.submit(context.run, self._run, node_id, inputs)
+        self._futures.append(future)
+
+    def _run(self, node_id, inputs: list[list]) -> None:
+        try:
+            output = self.executor.run_agent(node_id, self.nodes[node_id], [list(pair) for pair in inputs])
+        except NodeExecutionError as ex:
+            print(f"[{current_time()}] -- Pipelined run of node {node_id} failed, retried at the end:", ex)
+            output = None
+        with self._lock:
+            del self._running[node_id]
+            if output is not None:
+                self.results[node_id] = (inputs, output)
+            # inputs may have changed while running, and successors may now be ready
+            self._start_if_ready(node_id)
+            for edge in self.edges:
+                if edge["src_node"] == node_id:
+                    self._start_if_ready(edge["dest_node"])
+
+    def finish(self, plan: PlanDAG) -> PlanDAG:
+        """
+        Completes the execution of the final plan, reusing the pipelined results that are still valid.
+
+        Args:
+            plan (PlanDAG): The complete plan returned by the planner.
+
+        Returns:
+            PlanDAG: The executed plan.
+
+        Raises:
+            PlanValidationError: If the final plan has structural errors; the nodes left are not executed.
+            NodeExecutionError: If a node that has to be executed again fails.
+        """
+        while True:
+            with self._lock:
+                pending = [future for future in self._futures if not future.done()]
+            if not pending:
+                break
+            wait(pending)
+        self._pool.shutdown()
+
+        self.executor.set_plan(plan)
+        self.executor.check_plan()
+        dag = self.executor.plan_dag
+        reused = 0
+        for node_id in plan.topological_order():
+            inputs = self.executor.resolve_inputs(node_id)
+            result = self.results.get(node_id)
+            if result is not None and result[0] == inputs and dag.nodes[node_id]["name"] == self.nodes[node_id]["name"]:
+                for pair, (_, value) in zip(dag.nodes[node_id]["input"], inputs):
+                    pair[1] = value
+                original_exec = dag.nodes[node_id].get("exec", {})
+                dag.nodes[node_id]["exec"] = result[1]
+                self.executor.update_edge_flags(node_id, original_exec)
+                reused += 1
+            else:
+                self.executor.execute_node(node_id)
+        print(f"[{current_time()}] -- Pipelined execution reused {reused}/{dag.number_of_nodes()} node results")
+        plan = self.executor.get_plan()
+        plan.set_exec_status("EXECUTED")
+        return plan
\ No newline at end of file
@@ -1,10 +1,12 @@
+import hashlib
 import json
 from copy import deepcopy
 
-from networkx import MultiDiGraph
+from networkx import MultiDiGraph, descendants
 
 from custom_types import LLMPlan, UIPlan
-from structural_validity import validate_dag
+from metrics import cache_hits_total
+from structural_validity import TopologicalOrder, check_plan_structure
 from utils import create_uuid, current_time
 
 
@@ -15,11 +17,15 @@ class PlanDAG:
         """Initializes a PlanDAG instance."""
         self.dag = MultiDiGraph(id=create_uuid(), query=query, timestamp=current_time())
         self.query = query
+        self.order = TopologicalOrder()
 
-    def initialize_from_dag(self, dag: MultiDiGraph) -> "PlanDAG":
-        """Initializes the DAG from an existing MultiDiGraph."""
+    def initialize_from_dag(
+        self, dag: MultiDiGraph, order: TopologicalOrder | None = None
+    ) -> "PlanDAG":
+        """Initializes the DAG from an existing MultiDiGraph, reusing its topological order if known."""
         self.dag = dag
         self.query = dag.graph.get("query", "")
+        self.order = order if order is not None else TopologicalOrder.from_graph(dag)
         return self
 
     def initialize_from_LLMPlan(
@@ -28,12 +34,14 @@ class PlanDAG:
         """Initializes the DAG from an LLM-generated plan."""
         self.dag = PlanConverter.dag_from_LLMPlan(query, plan, agent_names)
         self.query = query
+        self.order = TopologicalOrder.from_graph(self.dag)
         return self
 
     def initialize_from_UIPlan(self, plan: UIPlan) -> "PlanDAG":
         """Initializes the DAG from a UI plan."""
         self.dag = PlanConverter.dag_from_UIPlan(plan)
         self.query = plan["query"]
+        self.order = TopologicalOrder.from_graph(self.dag)
         return self
 
     def get_plan_dag(self):
@@ -42,8 +50,14 @@ class PlanDAG:
 
     def set_plan_dag(self, dag):
         """Set planDAG"""
+        if dag is not self.dag:
+            self.order = TopologicalOrder.from_graph(dag)
         self.dag = dag
 
+    def topological_order(self) -> tuple:
+        """Nodes in topological order, maintained incrementally across edits."""
+        return self.order.nodes()
+
     def get_nodes(self, data=True):
         """Retrieve nodes and corresponding data"""
         return self.dag.nodes(data=True)
@@ -59,10 +73,16 @@ class PlanDAG:
             query=self.dag.graph["query"],
             timestamp=self.dag.graph["timestamp"],
         )
+        if "exec_options" in self.dag.graph:
+            dag_copy.graph["exec_options"] = dict(self.dag.graph["exec_options"])
         dag_copy.add_nodes_from([deepcopy(n) for n in self.dag.nodes(data=True)])
         dag_copy.add_edges_from(self.dag.edges(data=True, keys=True))
         return dag_copy
 
+    def clone(self) -> "PlanDAG":
+        """Creates a new PlanDAG over a deep copy of the DAG, carrying over its topological order."""
+        return PlanDAG().initialize_from_dag(self.copy(), order=self.order.copy())
+
     def initialize_plan_status(self):
         """Initializes the plan status of all nodes and edges"""
         for node_id in self.dag.nodes():
@@ -106,41 +126,94 @@ class PlanDAG:
         """Set execution status for given node"""
         self.dag.nodes[node_id]["exec_status"] = val
 
-    def validate_plan(self):  # TODO: update func in accordance with new o->i format
-        """Validates a given plan for correctness."""
-        if not validate_dag(self.dag.edges()):
-            print("Error: Plan is an invalid DAG")
-
-        sink = 0
-        for id, node in self.dag.nodes(data=True):
-            input = node.get("input", {})
-            output = node.get("output", {})
-            if not input:
-                input = {}
-            if not output:
-                output = {}
-            input_edges = self.dag.in_edges(id, data=True)
-            output_edges = self.dag.out_edges(id, data=True)
-            if len(input) != len(input_edges):
-                print(
-                    f"Error: Node {id} has mismtach of input edges and required inputs"
-                )
-            if len(output) != len(output_edges):
-                sink += 1
-        if sink != 1:
-            print(f"Error: Node {id} has mismtach of output edges and required outputs")
+    def node_hashes(self) -> dict:
+        """
+        Computes a Merkle hash of every node over its agent, task, outputs, params, literal inputs
+        and, for the inputs bound by edges, the hashes and output names of the source nodes.
+        Equal hashes mean equal results, whatever the node ids or the plan version.
+
+        Returns:
+            dict: Node id to hex digest.
+        """
+        hashes = {}
+        for node_id in self.topological_order():
+            node = self.dag.nodes[node_id]
+            bound = sorted(
+                [hashes[src], d.get("src_output"), d.get("dest_input")]
+                for src, _, d in self.dag.in_edges(node_id, data=True)
+            )
+            bound_inputs = {dest_input for _, _, dest_input in bound}
+            content = {
+                "name": node.get("name"),
+                "task": node.get("task"),
+                "output": list(node.get("output", [])),
+                "params": node.get("params", {}),
+                # executed plans hold the resolved values of bound inputs, so only literals count
+                "input": [[name, value] for name, value in node.get("input", []) if name not in bound_inputs],
+                "edges": bound,
+            }
+            encoded = json.dumps(content, sort_keys=True, default=str).encode()
+            hashes[node_id] = hashlib.sha256(encoded).hexdigest()
+        return hashes
+
+    def carry_over_results(self, prev_plans: list["PlanDAG"]) -> int:
+        """
+        Copies execution results from earlier plan versions into the nodes with the same hash.
+
+        Args:
+            prev_plans (list[PlanDAG]): Earlier plan versions, oldest first; later versions win.
+
+        Returns:
+            int: Number of nodes whose results were reused.
+        """
+        results = {}
+        for prev_plan in prev_plans:
+            for node_id, node_hash in prev_plan.node_hashes().items():
+                node = prev_plan.dag.nodes[node_id]
+                if node.get("exec") and node.get("exec_status") in ["EXECUTED", "MODIFIED"]:
+                    results[node_hash] = node
+
+        reused = 0
+        for node_id, node_hash in self.node_hashes().items():
+            if node_hash in results:
+                prev_node = results[node_hash]
+                node = self.dag.nodes[node_id]
+                node["input"] = deepcopy(prev_node["input"])
+                node["exec"] = deepcopy(prev_node["exec"])
+                node["exec_status"] = prev_node["exec_status"]
+                reused += 1
+        if reused:
+            cache_hits_total.inc(reused, cache="subplan")
+        return reused
+
+    def validate_plan(self, agent_registry=None) -> list[dict]:
+        """
+        Validates a given plan for correctness.
+
+        Args:
+            agent_registry (AgentRegistry | None): Also checks the nodes against their agents when given.
+
+        Returns:
+            list[dict]: Problems found (see check_plan_structure()); empty if the plan is valid.
+        """
+        problems = check_plan_structure(self.dag, agent_registry)
+        for problem in problems:
+            print(f"{problem['severity'].capitalize()}: {problem['message']}")
+        return problems
 
     def add_node(self, node_id, node_data):
         """Adds a new node to the DAG."""
         if node_id in self.dag:
             raise ValueError(f"Node '{node_id}' already exists.")
         self.dag.add_node(node_id, **node_data)
+        self.order.add_node(node_id)
 
     def remove_node(self, node_id):
         """Removes a node from the DAG."""
         if node_id not in self.dag:
             raise KeyError(f"Node '{node_id}' does not exist.")
         self.dag.remove_node(node_id)
+        self.order.remove_node(node_id)
 
     def add_edge(self, src, dest, edge_data):
         """Adds an edge to the DAG."""
@@ -148,6 +221,11 @@ class PlanDAG:
             raise KeyError(f"Source node '{src}' does not exist.")
         if dest not in self.dag:
             raise KeyError(f"Destination node '{dest}' does not exist.")
+        cycle = self.order.add_edge(self.dag, src, dest)
+        if cycle:
+            raise ValueError(
+                f"Edge {src} -> {dest} would create a cycle: {' -> '.join(str(n) for n in cycle)}"
+            )
         key = (edge_data["src_output"], edge_data["dest_input"])
         self.dag.add_edge(src, dest, key, **edge_data)
 
@@ -156,24 +234,61 @@ class PlanDAG:
         key = (edge_data["src_output"], edge_data["dest_input"])
         self.dag.remove_edge(src, dest, key)
 
+    def _result_key(self, node_id) -> str:
+        """What the result of a node depends on in this plan, as in node_hashes() but one level deep."""
+        node = self.dag.nodes[node_id]
+        edges = sorted(
+            [src, d.get("src_output"), d.get("dest_input")]
+            for src, _, d in self.dag.in_edges(node_id, data=True)
+        )
+        bound_inputs = {dest_input for _, _, dest_input in edges}
+        content = {
+            "name": node.get("name"),
+            "task": node.get("task"),
+            "output": list(node.get("output", [])),
+            "params": node.get("params", {}),
+            "input": [[name, value] for name, value in node.get("input", []) if name not in bound_inputs],
+            "edges": edges,
+        }
+        return json.dumps(content, sort_keys=True, default=str)
+
+    def invalidate_results(self, node_id):
+        """
+        Clears the result of a node whose content changed, and the results computed from it, so
+        that carry_over_results() never reuses them under the new content's hash. Results the
+        user entered on later nodes (exec_status MODIFIED) are kept.
+        """
+        node = self.dag.nodes[node_id]
+        node["exec"] = None
+        node["exec_status"] = "NONE"
+        for dest in descendants(self.dag, node_id):
+            if self.dag.nodes[dest].get("exec_status") == "EXECUTED":
+                self.dag.nodes[dest]["exec"] = None
+                self.dag.nodes[dest]["exec_status"] = "NONE"
+
     def update_node(self, node_id, node_data):
-        """Updates the data of an existing node."""
+        """Updates the data of an existing node, clearing its results if its content changed."""
         if node_id not in self.dag:
             raise KeyError(f"Node '{node_id}' does not exist.")
         
         model = node_data['params'].get('model', None)
         if model and model not in ["gpt-4o", "gpt-4o-mini"]:
             node_data['params']['model'] = "gpt-4o"
+        before = self._result_key(node_id)
         self.dag.nodes[node_id].update(node_data)
+        if self._result_key(node_id) != before:
+            self.invalidate_results(node_id)
 
     def update_node_edge(self, node_id, node_data, edges):
-        """Update node info and corresponding edges"""
+        """Update node info and corresponding edges, clearing the results of the nodes whose content or inputs changed"""
         if node_id not in self.dag:
             raise KeyError(f"Node '{node_id}' does not exist.")
+        affected = {node_id, *self.dag.successors(node_id)}
+        before = {n: self._result_key(n) for n in affected}
         self.dag.nodes[node_id].update(node_data)
 
-        all_edges = list(self.dag.in_edges(node_id, keys=True)) + list(
-            self.dag.out_edges(node_id, keys=True)
+        all_edges = list(self.dag.in_edges(node_id, keys=True, data=True)) + list(
+            self.dag.out_edges(node_id, keys=True, data=True)
         )
         self.dag.remove_edges_from(all_edges)
 
@@ -182,8 +297,23 @@ class PlanDAG:
             src = int(edge["source"])
             dest = int(edge["target"])
             key = (edge["data"]["src_output"], edge["data"]["dest_input"])
+            cycle = self.order.add_edge(self.dag, src, dest)
+            if cycle:
+                # restore the previous edges; re-adding them through the order keeps it consistent
+                self.dag.remove_edges_from(new_edges)
+                for s, t, k, d in all_edges:
+                    self.order.add_edge(self.dag, s, t)
+                    self.dag.add_edge(s, t, k, **d)
+                raise ValueError(
+                    f"Edges of node {node_id} would create a cycle: {' -> '.join(str(n) for n in cycle)}"
+                )
             new_edges.append((src, dest, key, edge["data"]))
-        self.dag.add_edges_from(new_edges)
+            self.dag.add_edge(src, dest, key, **edge["data"])
+
+        affected.update(self.dag.successors(node_id))
+        for n in self.order.nodes():
+            if n in affected and self._result_key(n) != before.get(n):
+                self.invalidate_results(n)
 
     def update_exec(self, node_id, node_exec, node_attr, node_attr_value):
         """Updates the execution result of an existing node"""
@@ -301,6 +431,8 @@ class PlanConverter:
         dag = MultiDiGraph(
             id=plan["id"], query=plan["query"], timestamp=plan["timestamp"]
         )
+        if plan.get("exec_options"):
+            dag.graph["exec_options"] = plan["exec_options"]
         dag.add_nodes_from(
             [
                 (int(n["id"]), n["data"])
@@ -355,6 +487,7 @@ class PlanConverter:
             "id": dag.graph["id"],
             "query": dag.graph["query"],
             "timestamp": dag.graph["timestamp"],
+            "exec_options": dag.graph.get("exec_options", {}),
             "nodes": nodes,
             "edges": edges,
         }
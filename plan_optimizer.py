@@ -0,0 +1,164 @@
+import heapq
+import json
+
+from agents import LLMAgent
+from plan import PlanDAG
+
+
+def _agent(agent_registry, name: str):
+    return agent_registry.get_agent(name) or agent_registry.get_agent("fallback")
+
+
+def find_common_subexpressions(plan: PlanDAG, agent_registry) -> dict:
+    """
+    Finds nodes that compute the same result as an earlier node.
+
+    Two nodes are equivalent when they use the same agent and params and receive the same
+    inputs: equal literals, or edges from equivalent nodes' corresponding outputs. Nodes of
+    LLM-backed agents must also share the task and the input and output names, which are part
+    of their prompt; local agents only depend on the input values, in order.
+
+    Args:
+        plan (PlanDAG): The plan to analyze.
+        agent_registry (AgentRegistry): Registry used to tell local agents from LLM-backed ones.
+
+    Returns:
+        dict: Duplicate node id to the id of its representative, which comes first in topological order.
+    """
+    dag = plan.dag
+    representative = {}  # node id -> representative id, for every node
+    seen = {}  # key -> representative id
+    for node_id in plan.topological_order():
+        node = dag.nodes[node_id]
+        local = _agent(agent_registry, node.get("name")).local
+
+        bindings = {}
+        for src, _, d in dag.in_edges(node_id, data=True):
+            # outputs are matched by position, since equivalent nodes may name them differently
+            outputs = dag.nodes[src].get("output", [])
+            position = outputs.index(d["src_output"]) if d["src_output"] in outputs else d["src_output"]
+            bindings[d["dest_input"]] = {"edge": [representative[src], position]}  # the last edge wins, as in the executor
+        inputs = []
+        for name, value in node.get("input", []):
+            resolved = bindings.get(name, value)
+            inputs.append(resolved if local else [name, resolved])
+
+        key = {
+            "name": node.get("name"),
+            "params": node.get("params", {}),
+            "input": inputs,
+            "output": len(node.get("output", [])) if local else list(node.get("output", [])),
+        }
+        if not local:
+            key["task"] = node.get("task")
+        key = json.dumps(key, sort_keys=True, default=str)
+        representative[node_id] = seen.setdefault(key, node_id)
+
+    return {node_id: rep for node_id, rep in representative.items() if node_id != rep}
+
+
+def is_fusible(agent) -> bool:
+    """Local agents exposing compute(operands) can be evaluated inline by the executor."""
+    return agent.local and callable(getattr(agent, "compute", None))
+
+
+def fusion_schedule(plan: PlanDAG, agent_registry, exclude=()) -> list[tuple[bool, list]]:
+    """
+    Orders the plan for execution so that fusible arithmetic nodes form the longest possible runs.
+
+    The nodes are emitted in a topological order that keeps emitting the same kind of node
+    (fusible or not) while one is ready. Each run of consecutive fusible nodes is convex, since
+    any path between two of its nodes goes through nodes between them in the order, so it can be
+    evaluated in one pass once the nodes before it are done.
+
+    Args:
+        plan (PlanDAG): The plan to schedule.
+        agent_registry (AgentRegistry): Registry used to find the agent of each node.
+        exclude (Iterable): Nodes that must not be fused, e.g. common subexpression duplicates.
+
+    Returns:
+        list[tuple[bool, list]]: Steps in execution order: (True, run of fusible nodes) or (False, [node]).
+    """
+    dag = plan.dag
+    exclude = set(exclude)
+    fusible = {
+        node_id for node_id in dag
+        if node_id not in exclude and is_fusible(_agent(agent_registry, dag.nodes[node_id].get("name")))
+    }
+    rank = {node_id: i for i, node_id in enumerate(plan.topological_order())}  # ties follow the plan order
+    indegree = {node_id: dag.in_degree(node_id) for node_id in dag}
+    ready = {True: [], False: []}
+    for node_id, degree in indegree.items():
+        if degree == 0:
+            heapq.heappush(ready[node_id in fusible], (rank[node_id], node_id))
+
+    steps = []
+    kind = False
+    while ready[True] or ready[False]:
+        if not ready[kind]:
+            kind = not kind
+        _, node_id = heapq.heappop(ready[kind])
+        if kind and steps and steps[-1][0]:
+            steps[-1][1].append(node_id)
+        else:
+            steps.append((kind, [node_id]))
+        for _, dest in dag.out_edges(node_id):
+            indegree[dest] -= 1
+            if indegree[dest] == 0:
+                heapq.heappush(ready[dest in fusible], (rank[dest], dest))
+    return steps
+
+
+def find_llm_chains(plan: PlanDAG, agent_registry, exclude=()) -> list[list]:
+    """
+    Finds chains of LLM-backed nodes that can be answered by one call.
+
+    Only nodes of LLMAgent agents are chained, since the chain is one LLMAgent call. A node is
+    chained to its successor when it is that successor's only predecessor, the successor is its
+    only consumer and both use the same params, model config and execution policy, since the
+    whole chain runs with the head's. Intermediate outputs are then only passed along the chain.
+
+    Args:
+        plan (PlanDAG): The plan to analyze.
+        agent_registry (AgentRegistry): Registry used to tell local agents from LLM-backed ones.
+        exclude (Iterable): Nodes that must not be chained, e.g. nodes with their own execution policy.
+
+    Returns:
+        list[list]: Chains of two or more node ids, each in execution order.
+    """
+    dag = plan.dag
+    exclude = set(exclude)
+
+    def chainable(node_id):
+        return node_id not in exclude and isinstance(_agent(agent_registry, dag.nodes[node_id].get("name")), LLMAgent)
+
+    def compatible(node_id, succ):
+        agent, succ_agent = (_agent(agent_registry, dag.nodes[n].get("name")) for n in (node_id, succ))
+        return (
+            dag.nodes[succ].get("params") == dag.nodes[node_id].get("params")
+            and succ_agent.config == agent.config
+            and succ_agent.exec_policy == agent.exec_policy
+        )
+
+    chains = []
+    chained = set()
+    for node_id in plan.topological_order():
+        if node_id in chained or not chainable(node_id):
+            continue
+        chain = [node_id]
+        while True:
+            successors = set(dag.successors(chain[-1]))
+            if len(successors) != 1:
+                break
+            (succ,) = successors
+            if (
+                not chainable(succ)
+                or set(dag.predecessors(succ)) != {chain[-1]}
+                or not compatible(chain[-1], succ)
+            ):
+                break
+            chain.append(succ)
+        if len(chain) > 1:
+            chains.append(chain)
+            chained.update(chain)
+    return chains
\ No newline at end of file
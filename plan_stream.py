@@ -0,0 +1,97 @@
+import json
+
+from pydantic import ValidationError
+
+from custom_types import Edge, Node
+
+
+class IncrementalPlanParser:
+    """
+    Parses the JSON of an LLMPlan while it is being generated.
+
+    Text is fed in arbitrary chunks; every element of the top-level `nodes` and `edges`
+    arrays is returned as soon as its closing brace arrives and it validates against the
+    Node or Edge model.
+
+    Attributes:
+        text (str): All text fed so far.
+        nodes (list[dict]): Completed, valid nodes in arrival order.
+        edges (list[dict]): Completed, valid edges in arrival order.
+    """
+    MODELS = {"nodes": Node, "edges": Edge}
+
+    def __init__(self):
+        self.text = ""
+        self.nodes: list[dict] = []
+        self.edges: list[dict] = []
+        self._pos = 0  # next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._last_key = None  # last complete string at the top level
+        self._string_start = None
+        self._array = None  # "nodes" or "edges" while inside one of them
+        self._element_start = None
+
+    def feed(self, chunk: str) -> list[tuple[str, dict]]:
+        """
+        Adds generated text.
+
+        Args:
+            chunk (str): The next piece of the JSON document.
+
+        Returns:
+            list[tuple[str, dict]]: ("nodes" or "edges", element) for every element completed by this chunk.
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._last_key in self.MODELS:
+                    self._array = self._last_key
+                elif self._depth == 3 and char == "{" and self._array:
+                    self._element_start = i
+            elif char in "}]":
+                if self._depth == 3 and char == "}" and self._element_start is not None:
+                    element = self._parse_element(text[self._element_start:i + 1])
+                    if element is not None:
+                        getattr(self, self._array).append(element)
+                        completed.append((self._array, element))
+                    self._element_start = None
+                elif self._depth == 2:
+                    self._array = None
+                self._depth -= 1
+        self._pos = len(text)
+        return completed
+
+    def _parse_element(self, text: str) -> dict | None:
+        try:
+            element = json.loads(text)
+            self.MODELS[self._array].model_validate(element)
+        except (json.JSONDecodeError, ValidationError):
+            return None  # left to the validation of the complete plan
+        return element
+
+    def partial_plan(self) -> dict:
+        """Returns the plan received so far, keeping only edges between received nodes."""
+        node_ids = {node["id"] for node in self.nodes}
+        edges = [
+            edge for edge in self.edges
+            if edge["src_node"] in node_ids and edge["dest_node"] in node_ids
+        ]
+        return {"nodes": list(self.nodes), "edges": edges}
\ No newline at end of file
@@ -1,9 +1,17 @@
 import json
+from typing import Callable
+
+from networkx import MultiDiGraph
 
 from custom_types import LLMPlan
+from llm_scheduler import LLMSlot, Priority, scheduler
+from model_cascade import cascade_models, run_cascade
 from plan import PlanConverter, PlanDAG
+from plan_stream import IncrementalPlanParser
 from prompts import PLAN_REFINE_PROMPT, PLAN_SYSTEM_PROMPT, PLAN_FIX_PROMPT
-from utils import openai_client
+from structural_validity import check_plan_structure
+from tracing import span
+from utils import create_uuid, current_time, get_openai_client
 
 
 class Planner:
@@ -17,7 +25,12 @@ class Planner:
         fix_plan_prompt (str): Template for fixing incomplete or incorrect plans.
         client (object): OpenAI client used for LLM interactions.
         config (dict): Configuration parameters for the model execution.
+        cascade (list[str] | None): Cheaper models asked first, whose plans are only used if they
+            pass the local checks (default: model_cascade.DEFAULT_CASCADE; [] always uses the configured model).
         agent_registry (AgentRegistry): Registry containing all available agents.
+        on_partial_plan (Callable[[MultiDiGraph], None] | None): When set, new plans are streamed and
+            the plan received so far is passed to it each time a node or edge is completed. Only the
+            last model of the cascade streams, so a rejected plan is never shown.
     """
     def __init__(self, agent_registry):
         """Initializes planner with agent registry, and required prompts and configurations"""
@@ -27,31 +40,42 @@ class Planner:
         )
         self.refine_prompt = PLAN_REFINE_PROMPT
         self.fix_plan_prompt = PLAN_FIX_PROMPT
-        self.client = openai_client
         self.config = {"model": "gpt-4o", "temperature": 0, "response_format": LLMPlan}
+        self.cascade: list[str] | None = None
         self.agent_registry = agent_registry
         self.agent_names = agent_registry.get_agents_names()
+        self.on_partial_plan: Callable[[MultiDiGraph], None] | None = None
+
+    @property
+    def client(self):
+        # built on the first call, so creating a session does not load the OpenAI SDK
+        return get_openai_client()
 
     def modify_config(self, params):
-        """Modifies the LLM configuration."""
+        """Modifies the LLM configuration; a "cascade" key replaces the models asked first."""
+        params = dict(params)
+        if "cascade" in params:
+            self.cascade = params.pop("cascade")
         self.config.update(params)
 
     def append_plan(self, plan):
         """Appends a new plan to the history."""
         self.plan_history.append(plan)
 
-    def generate_plan(self, query: str, is_replan: bool = False) -> PlanDAG:
+    def generate_plan(self, query: str, is_replan: bool = False, pipeline=None) -> PlanDAG:
         """
         Generates a new plan based on the user query.
 
         Args:
             query (str): The user's query or task description.
             is_replan (bool): Indicates if it is a replan (default: False).
+            pipeline (PipelinedExecution | None): Receives nodes and edges as they are generated,
+                to start executing them before the plan is complete (default: None).
 
         Returns:
             PlanDAG: The generated plan in DAG format.
         """
-        llm_plan = self._llm_planner(query)
+        llm_plan = self._llm_planner(query, pipeline)
         plan = PlanDAG().initialize_from_LLMPlan(query, llm_plan, self.agent_names)
         if not is_replan:
             plan.initialize_plan_status()
@@ -59,6 +83,8 @@ class Planner:
         else:
             plan.set_plan_status("MODIFIED")
         plan.initialize_params(agent_registry=self.agent_registry)
+        if is_replan:
+            self._reuse_results(plan)
         self.plan_history.append(plan)
         return plan
 
@@ -83,6 +109,7 @@ class Planner:
         plan.initialize_plan_status()
         plan.intitialize_exec_status()
         plan.initialize_params(agent_registry=self.agent_registry)
+        self._reuse_results(plan)
         self.plan_history.append(plan)
         return plan 
 
@@ -98,7 +125,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.add_node(node_id, node_data)
         plan.set_node_plan_status(node_id, "MODIFIED")
         self.plan_history.append(plan)
@@ -115,7 +142,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.remove_node(node_id)
         self.plan_history.append(plan)
         return plan
@@ -132,7 +159,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.update_node(node_id, node_data)
         plan.set_node_plan_status(node_id, "MODIFIED")
         self.plan_history.append(plan)
@@ -151,7 +178,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.update_node_edge(node_id, node_data, edges)
         plan.set_node_plan_status(node_id, "MODIFIED")
         self.plan_history.append(plan)
@@ -170,7 +197,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.add_edge(src, dest, edge_data)
         plan.set_edge_plan_status(src, dest, "MODIFIED", key=(edge_data["src_output"], edge_data["dest_input"]))
         self.plan_history.append(plan)
@@ -189,7 +216,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.remove_edge(src, dest, edge_data)
         self.plan_history.append(plan)
         return plan
@@ -206,7 +233,7 @@ class Planner:
         Returns:
             PlanDAG: The updated plan with modified execution results and status.
         """
-        plan = PlanDAG().initialize_from_dag(prev_plan.copy())
+        plan = prev_plan.clone()
         plan.update_exec(node_id, node_exec, node_attr, node_attr_value)
         plan.set_node_exec_status(node_id, "MODIFIED")
         self.plan_history.append(plan)
@@ -228,9 +255,16 @@ class Planner:
         plan = PlanDAG().initialize_from_LLMPlan(prev_plan.query, llm_plan, self.agent_names)
         plan.set_plan_status("MODIFIED")
         plan.initialize_params(agent_registry=self.agent_registry)
+        self._reuse_results(plan)
         self.plan_history.append(plan)
         return plan
 
+    def _reuse_results(self, plan: PlanDAG) -> None:
+        """Carries results from the plan history over to the unchanged nodes of a new plan version."""
+        reused = plan.carry_over_results(self.plan_history)
+        if reused:
+            print(f"[{current_time()}] -- Reused results of {reused}/{plan.dag.number_of_nodes()} nodes from earlier plans")
+
     def refine_plan_dm(self, refined_plan) -> PlanDAG:
         """
         Refines the existing plan using direct manipulation.
@@ -255,12 +289,13 @@ class Planner:
         self.plan_history = []
 
 
-    def _llm_planner(self, query: str) -> LLMPlan:
+    def _llm_planner(self, query: str, pipeline=None) -> LLMPlan:
         """
         Uses LLM to generate a plan based on the user query.
 
         Args:
             query (str): The user query to generate the plan.
+            pipeline (PipelinedExecution | None): Receives nodes and edges as they are generated.
 
         Returns:
             LLMPlan: The generated plan in LLM format.
@@ -269,11 +304,94 @@ class Planner:
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": query},
         ]
-        response = self.client.beta.chat.completions.parse(
-            messages=messages, **self.config
+        return self._complete_plan(
+            messages, "_llm_planner", query, pipeline, stream=self.on_partial_plan is not None or pipeline is not None
         )
-        response_obj = json.loads(response.choices[0].message.content)
-        return response_obj
+
+    def _complete_plan(
+        self, messages: list[dict], site: str, query: str = "", pipeline=None, stream: bool = False
+    ) -> LLMPlan:
+        """
+        Requests a plan through the model cascade: the plan of each cheaper model is checked
+        against the LLMPlan schema and for structural errors, and requested again from the next
+        model if a check fails. Only the configured model, tried last, streams: the plans of the
+        cheaper models may still be rejected and must not reach `on_partial_plan`. Pipelined plans
+        use the configured model only, since their nodes start executing while they are generated.
+
+        Args:
+            messages (list[dict]): Chat messages of the completion request.
+            site (str): Call site, used for the scheduler, tracing and metrics.
+            query (str): The user query, attached to streamed partial plans.
+            pipeline (PipelinedExecution | None): Receives nodes and edges as they are generated.
+            stream (bool): Whether to stream the completion of the last model (see _stream_plan()).
+
+        Returns:
+            LLMPlan: The accepted plan in LLM format.
+        """
+        models = cascade_models(self.config["model"], [] if pipeline is not None else self.cascade)
+
+        def call(model: str) -> LLMPlan:
+            config = {**self.config, "model": model}
+            with span("planning", step=site, model=model), scheduler.slot(Priority.PLANNING, messages, site=site, max_output_tokens=2048) as slot:
+                if stream and model == models[-1]:
+                    return self._stream_plan(query, messages, slot, config, pipeline)
+                response = self.client.beta.chat.completions.parse(
+                    messages=messages, **config
+                )
+                slot.record(response)
+            return json.loads(response.choices[0].message.content)
+
+        return run_cascade(call, self._check_plan, models, site)
+
+    def _check_plan(self, llm_plan: LLMPlan) -> None:
+        """Raises ValueError if a generated plan does not match the LLMPlan schema or has structural errors."""
+        LLMPlan.model_validate(llm_plan)
+        plan = PlanDAG().initialize_from_LLMPlan("", llm_plan, self.agent_names)  # raises on cycles
+        errors = [p["message"] for p in check_plan_structure(plan.dag, self.agent_registry) if p["severity"] == "error"]
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    def _stream_plan(self, query: str, messages: list[dict], slot: LLMSlot, config: dict, pipeline=None) -> LLMPlan:
+        """
+        Streams a plan completion, passing the partial plan to `on_partial_plan` whenever a node
+        or an edge between received nodes is completed.
+
+        Args:
+            query (str): The user query, attached to the partial plans.
+            messages (list[dict]): Chat messages of the completion request.
+            slot (LLMSlot): Scheduler slot the call runs in, used to record token usage.
+            config (dict): Model configuration of the completion request.
+            pipeline (PipelinedExecution | None): Receives every completed node and edge.
+
+        Returns:
+            LLMPlan: The complete plan, parsed exactly as a non-streamed response.
+        """
+        parser = IncrementalPlanParser()
+        partial_id = create_uuid()
+        with self.client.beta.chat.completions.stream(
+            messages=messages, stream_options={"include_usage": True}, **config
+        ) as stream:
+            for event in stream:
+                if event.type != "content.delta":
+                    continue
+                completed = parser.feed(event.delta)
+                if pipeline is not None:
+                    for kind, element in completed:
+                        pipeline.add(kind, element)
+                if not completed or self.on_partial_plan is None:
+                    continue
+                partial = {**parser.partial_plan(), "id": partial_id}
+                try:
+                    plan = PlanDAG().initialize_from_LLMPlan(query, partial, self.agent_names)
+                except ValueError:
+                    continue  # cycle among the edges so far, left to the complete plan
+                plan.initialize_plan_status()
+                plan.intitialize_exec_status()
+                plan.initialize_params(agent_registry=self.agent_registry)
+                self.on_partial_plan(plan.dag)
+            completion = stream.get_final_completion()
+        slot.record(completion)
+        return json.loads(completion.choices[0].message.content)
 
     def _llm_refiner(self, prev_plan, feedback):
         """
@@ -295,11 +413,7 @@ class Planner:
                 ),
             },
         ]
-        response = self.client.beta.chat.completions.parse(
-            messages=messages, **self.config
-        )
-        response_obj = json.loads(response.choices[0].message.content)
-        return response_obj
+        return self._complete_plan(messages, "_llm_refiner")
     
     def _llm_fixer(self, query, plan):
         """
@@ -321,8 +435,4 @@ class Planner:
                 ),
             },
         ]
-        response = self.client.beta.chat.completions.parse(
-            messages=messages, **self.config
-        )
-        response_obj = json.loads(response.choices[0].message.content)
-        return response_obj
\ No newline at end of file
+        return self._complete_plan(messages, "_llm_fixer")
\ No newline at end of file
@@ -0,0 +1,58 @@
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+def profile_imports(module: str) -> tuple[float, list[tuple[int, int, str]]]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): Module to import, e.g. "server".
+
+    Returns:
+        tuple[float, list[tuple[int, int, str]]]:
+            - Wall time of the whole interpreter run, in seconds.
+            - (self us, cumulative us, module name) of every module imported.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).parent,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(own), int(cumulative), name.strip()))
+    return elapsed, entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Lists the slowest imports of a module, to keep worker and CLI cold starts short."
+    )
+    parser.add_argument("module", nargs="?", default="server")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument(
+        "--self", dest="by_self", action="store_true",
+        help="rank by time spent in the module itself instead of including its imports",
+    )
+    args = parser.parse_args()
+
+    elapsed, entries = profile_imports(args.module)
+    total = next((cumulative for _, cumulative, name in entries if name == args.module), 0)
+    print(f"import {args.module}: {total / 1000:.1f} ms ({elapsed * 1000:.0f} ms including interpreter start)")
+    entries.sort(key=lambda entry: entry[0] if args.by_self else entry[1], reverse=True)
+    print(f"{'self ms':>9} {'total ms':>9}  module")
+    for own, cumulative, name in entries[: args.top]:
+        print(f"{own / 1000:9.1f} {cumulative / 1000:9.1f}  {name}")
\ No newline at end of file
@@ -32,9 +32,11 @@ Your response should follow this JSON format:
     'action': <action id>,
     'user_query': <query> or null,
     'plan_feedback': <plan feedback> or null,
-    'execute': {{ 'mode': 'single' or 'all', 'node_id': <node id> or null }}
+    'execute': {{ 'mode': 'single' or 'propagate' or 'up-to' or 'all', 'node_id': <node id> or null }}
 }}
 
+Execution modes: 'single' runs one step, 'propagate' runs a step and every step after it, 'up-to' runs the steps a step needs and then that step, 'all' runs every step.
+
 <examples>
 User: hi
 action = 0
@@ -50,6 +52,10 @@ User: what are the average salary of those companies?
 action=1, user_query='average salary of companies hiring data scientists in sunnyvale'
 User: 1+2+3
 action=1, user_query='calculate 1+2+3'
+User: run step 2 and everything after it
+action=3, execute={{'mode': 'propagate', 'node_id': 2}}
+User: what is the result of step 4?
+action=3, execute={{'mode': 'up-to', 'node_id': 4}}
 </examples>
 """
 
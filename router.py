@@ -0,0 +1,254 @@
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import traceback
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import ConnectionClosed
+
+from metrics import merge_shards
+from utils import ALLOWED_ORIGINS, MsgType, Status, current_time
+
+
+def parse_shard_id(session_id: str) -> int | None:
+    """Returns the shard encoded in a session id (`<shard>-<uuid>`), or None."""
+    shard, sep, _ = session_id.partition("-")
+    if not sep or not shard.isdigit():
+        return None
+    return int(shard)
+
+
+class ShardSupervisor:
+    """
+    Spawns and watches one server worker process per shard.
+    Each worker serves `server:app` on its own unix domain socket and owns
+    the sessions whose id starts with its shard number.
+
+    Attributes:
+        num_shards (int): Number of worker processes.
+        socket_dir (Path): Directory holding the worker sockets.
+        processes (dict[int, subprocess.Popen]): Running worker per shard.
+        load (dict[int, dict]): Last load report received from each shard.
+        connections (dict[int, int]): Websockets currently proxied to each shard.
+    """
+    def __init__(self, num_shards: int, socket_dir: str | None = None):
+        """Initializes the supervisor without starting any worker."""
+        self.num_shards = num_shards
+        self.socket_dir = Path(socket_dir or tempfile.mkdtemp(prefix="aipom-shards-"))
+        self.processes: dict[int, subprocess.Popen] = {}
+        self.load: dict[int, dict] = {shard: {} for shard in range(num_shards)}
+        self.connections: dict[int, int] = {shard: 0 for shard in range(num_shards)}
+        self.clients: dict[int, httpx.AsyncClient] = {}
+        self._round_robin = itertools.cycle(range(num_shards))
+
+    def socket_path(self, shard: int) -> str:
+        """Path of the unix socket served by the given shard."""
+        return str(self.socket_dir / f"shard-{shard}.sock")
+
+    def start(self) -> None:
+        """Starts every worker process and its HTTP client."""
+        for shard in range(self.num_shards):
+            self._spawn(shard)
+            self.clients[shard] = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=self.socket_path(shard)),
+                base_url="http://shard",
+            )
+
+    async def stop(self) -> None:
+        """Stops every worker process."""
+        for client in self.clients.values():
+            await client.aclose()
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _spawn(self, shard: int) -> None:
+        path = self.socket_path(shard)
+        if os.path.exists(path):
+            os.remove(path)
+        env = {**os.environ, "AIPOM_SHARD_ID": str(shard)}
+        self.processes[shard] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--uds", path],
+            env=env,
+            cwd=Path(__file__).parent,
+        )
+        print(f"[{current_time()}] Shard {shard} started (pid {self.processes[shard].pid})")
+
+    async def watch(self, interval: float = 2.0) -> None:
+        """Restarts crashed workers and refreshes the per-shard load reports."""
+        while True:
+            for shard, process in self.processes.items():
+                if process.poll() is not None:
+                    print(f"[{current_time()}] Shard {shard} exited ({process.returncode}), restarting")
+                    self._spawn(shard)
+            await asyncio.gather(
+                *(self._refresh_load(shard) for shard in range(self.num_shards))
+            )
+            await asyncio.sleep(interval)
+
+    async def _refresh_load(self, shard: int) -> None:
+        try:
+            response = await self.clients[shard].get("/shard-load")
+            self.load[shard] = response.json()
+        except httpx.HTTPError:
+            self.load[shard] = {}
+
+    def pick_shard(self) -> int:
+        """Chooses the shard with the fewest sessions, round robin among ties."""
+        counts = {
+            shard: self.load[shard].get("sessions", 0) for shard in range(self.num_shards)
+        }
+        least = min(counts.values())
+        for _ in range(self.num_shards):
+            shard = next(self._round_robin)
+            if counts[shard] == least:
+                return shard
+        return next(self._round_robin)
+
+    def get_load(self) -> list[dict]:
+        """Returns the load report of every shard."""
+        return [
+            {
+                "shard": shard,
+                "alive": shard in self.processes and self.processes[shard].poll() is None,
+                "proxied_connections": self.connections[shard],
+                **self.load[shard],
+            }
+            for shard in range(self.num_shards)
+        ]
+
+
+def create_app(num_shards: int) -> FastAPI:
+    """Builds the router app that fronts `num_shards` server workers."""
+    supervisor = ShardSupervisor(num_shards)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        supervisor.start()
+        watcher = asyncio.create_task(supervisor.watch())
+        yield
+        watcher.cancel()
+        await supervisor.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.supervisor = supervisor
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.get("/start-session")
+    async def start_session():
+        """Starts a new session on the least loaded shard"""
+        shard = supervisor.pick_shard()
+        response = await supervisor.clients[shard].get("/start-session")
+        supervisor.load[shard]["sessions"] = supervisor.load[shard].get("sessions", 0) + 1
+        return response.json()
+
+    @app.get("/agent-registry")
+    async def get_agent_registry():
+        """Returns agent list"""
+        response = await supervisor.clients[supervisor.pick_shard()].get("/agent-registry")
+        return response.json()
+
+    @app.get("/shards")
+    def get_shards():
+        """Returns per-shard load"""
+        return {"shards": supervisor.get_load()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        """Returns the metrics of every shard, labelled by shard"""
+        responses = await asyncio.gather(
+            *(supervisor.clients[shard].get("/metrics") for shard in range(num_shards)),
+            return_exceptions=True,
+        )
+        texts = {
+            str(shard): response.text
+            for shard, response in enumerate(responses)
+            if isinstance(response, httpx.Response)
+        }
+        return PlainTextResponse(merge_shards(texts), media_type="text/plain; version=0.0.4")
+
+    @app.websocket("/ws/{session_id}")
+    async def websocket_proxy(websocket: WebSocket, session_id: str):
+        await websocket.accept()
+
+        shard = parse_shard_id(session_id)
+        if shard is None or shard >= num_shards:
+            await websocket.send_json(
+                {
+                    "type": MsgType.STATUS,
+                    "data": {
+                        "action": "session",
+                        "status": Status.ERROR,
+                        "message": "Invalid session ID",
+                    },
+                }
+            )
+            await websocket.close()
+            return
+
+        supervisor.connections[shard] += 1
+        try:
+            async with unix_connect(
+                supervisor.socket_path(shard), f"ws://shard/ws/{session_id}"
+            ) as upstream:
+                await _pump(websocket, upstream)
+        except (WebSocketDisconnect, ConnectionClosed):
+            pass
+        except Exception as e:
+            print(f"[{current_time()}] Proxy error:", e, traceback.format_exc())
+        finally:
+            supervisor.connections[shard] -= 1
+            try:
+                await websocket.close()
+            except RuntimeError:
+                pass  # already closed by the client
+
+    dist_dir_path = "frontend/dist"
+    Path(dist_dir_path).mkdir(parents=True, exist_ok=True)
+    app.mount("/", StaticFiles(directory=dist_dir_path, html=True), name="dist")
+    return app
+
+
+async def _pump(websocket: WebSocket, upstream) -> None:
+    """Forwards frames in both directions until either side closes."""
+
+    async def client_to_upstream():
+        while True:
+            await upstream.send(await websocket.receive_text())
+
+    async def upstream_to_client():
+        async for message in upstream:
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
+
+    tasks = [
+        asyncio.create_task(client_to_upstream()),
+        asyncio.create_task(upstream_to_client()),
+    ]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        task.result()
@@ -1,28 +1,34 @@
+import argparse
+import asyncio
+import os
 import traceback
+from collections import deque
+from contextlib import nullcontext
 from pathlib import Path
 from uuid import uuid4
 
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
+import metrics
 from agent_registry import AgentRegistry
 from controller import Controller
+from llm_scheduler import scheduler, session_scope
 from custom_types import Message, SystemMessage, UIPlan
+from dispatcher import SessionDispatcher
+from outbound import OutboundQueue, SessionChannel
 from plan import PlanConverter
-from utils import MsgType, Status, current_time
+from tracing import span, start_trace
+from utils import ALLOWED_ORIGINS, MsgType, Status, current_time
 
 app = FastAPI()
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost",
-        "http://localhost:4173",  # vite preview
-        "http://localhost:5173",  # vite dev
-        "http://localhost:8000",  # fastapi
-    ],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -30,13 +36,26 @@ app.add_middleware(
 
 # dict to store controller for each session
 sessions: dict[str, dict] = {}
+# shard owned by this process when running behind the router (see router.py)
+shard_id = os.environ.get("AIPOM_SHARD_ID")
+active_connections = 0
+# timing breakdown of recent messages per session, recorded when tracing is on
+TRACE_ALL = os.environ.get("AIPOM_DEBUG_TIMING", "0") == "1"
+# execute new plans while they are generated instead of waiting for an execute request
+AUTO_EXECUTE = os.environ.get("AIPOM_AUTO_EXECUTE", "0") == "1"
+session_traces: dict[str, deque] = {}
+# messages of different lanes are handled concurrently, those of one lane in arrival order;
+# executions get their own lane so chat and plan edits are not blocked behind them
+MESSAGE_LANES = {MsgType.EXECUTE: "execution"}
+# connections of a session share its broadcast channel and message dispatcher
+channels: dict[str, tuple[SessionChannel, SessionDispatcher]] = {}
 
 
 @app.get("/start-session")
 def start_session():
     """Starts a new session and returns a session ID"""
-    session_id = str(uuid4())
-    sessions[session_id] = Controller()
+    session_id = f"{shard_id}-{uuid4()}" if shard_id is not None else str(uuid4())
+    sessions[session_id] = Controller(auto_execute=AUTO_EXECUTE)
     print(f"[{current_time()}] Session started: {session_id}")
     print(sessions)
     return {"session_id": session_id}
@@ -49,8 +68,46 @@ def get_agent_registry():
     return {"agent_registry": agent_registry}
 
 
+@app.get("/shard-load")
+def get_shard_load():
+    """Returns the load of this worker process"""
+    return {
+        "shard": shard_id,
+        "pid": os.getpid(),
+        "sessions": len(sessions),
+        "connections": active_connections,
+    }
+
+
+@app.get("/transport-stats")
+def transport_stats():
+    """Returns connection reuse per upstream"""
+    from transport import get_transport_stats  # loaded with the first API client otherwise
+
+    return {"upstreams": get_transport_stats()}
+
+
+@app.get("/llm-scheduler")
+def llm_scheduler_stats():
+    """Returns LLM queue depths per priority class and session"""
+    return scheduler.get_stats()
+
+
+@app.get("/sessions/{session_id}/traces")
+def get_session_traces(session_id: str):
+    """Returns timing breakdowns of the latest messages of a session"""
+    return {"traces": list(session_traces.get(session_id, []))}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Returns metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
+    global active_connections
     await websocket.accept()
 
     if session_id not in sessions:
@@ -68,31 +125,106 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         return
 
     controller = sessions[session_id]
+    active_connections += 1
     print(f"[{current_time()}] Client connected to session {session_id}")
 
+    # every message to this client goes out through one queue, in order,
+    # coalescing superseded plans and deltas
+    outbound = OutboundQueue(websocket)
+    if session_id not in channels:
+        channels[session_id] = _open_channel(session_id, controller)
+    channel, dispatcher = channels[session_id]
+    channel.subscribe(outbound)
+    _send_snapshot(outbound, controller)
+
     try:
         while True:
             message = await websocket.receive_json()
             msgType = message.get("type")
             msgData = message.get("data")
-            plan = system_response = chat_history = None
 
             if msgType == MsgType.CONNECTION:
                 print(
                     f"[{current_time()}] Connection state changed: {msgData['state']}"
                 )
+            elif msgType == MsgType.CANCEL:
+                # handled right away, not behind the execution it cancels
+                running = controller.cancel_execution()
+                print(f"[{current_time()}] Cancel requested, execution running: {running}")
+                _send_status(channel, msgType, Status.FINISHED)
             else:
                 print(f"[{current_time()}] Message received:", message)
-                await _send_status(websocket, msgType, Status.STARTING)
+                if msgType == MsgType.EXECUTE or (msgType == MsgType.CHAT and controller.auto_execute):
+                    # created now, so a cancel also reaches the execution while it is queued
+                    message["cancel_token"] = controller.new_cancel_token()
+                if msgType == MsgType.CHAT:
+                    # the other subscribers see the message as it is sent
+                    channel.send({"type": MsgType.CHAT, "data": {"user_message": msgData}}, exclude=outbound)
+                dispatcher.submit(MESSAGE_LANES.get(msgType, "conversation"), message)
+
+    except WebSocketDisconnect:
+        print(f"[{current_time()}] Client disconnected from session: {session_id}")
+    except Exception as e:
+        metrics.errors_total.inc(stage="websocket")
+        print(f"[{current_time()}] Error:", e, traceback.format_exc())
+    finally:
+        active_connections -= 1
+        channel.unsubscribe(outbound)
+        await outbound.close()
+        if not channel.subscribers and channels.get(session_id, (None,))[0] is channel:
+            del channels[session_id]
+            await dispatcher.close()
+            controller.on_response_delta = None
+            controller.planner.on_partial_plan = None
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed, e.g. after an outbound overflow
+        print(f"[{current_time()}] WebSocket closed for session: {session_id}")
+
 
+def _open_channel(session_id: str, controller: Controller) -> tuple[SessionChannel, SessionDispatcher]:
+    """
+    Creates the broadcast channel and message dispatcher shared by the connections of a session,
+    and streams the controller's responses and partial plans to the channel.
+    """
+    channel = SessionChannel()
+    # the controller runs in a worker thread; streamed messages are handed back to the loop
+    loop = asyncio.get_running_loop()
+
+    def stream(msg_type: str, data: dict) -> None:
+        loop.call_soon_threadsafe(channel.send, {"type": msg_type, "data": data})
+
+    controller.on_response_delta = lambda response_to, delta: stream(
+        MsgType.CHAT_DELTA, {"response_to": response_to, "delta": delta}
+    )
+    controller.planner.on_partial_plan = lambda dag: stream(
+        MsgType.PLAN, {"plan": PlanConverter.dag_to_UIPlan(dag), "partial": True}
+    )
+
+    async def handle_message(message: dict) -> None:
+        msgType = message.get("type")
+        msgData = message.get("data")
+        plan = system_response = chat_history = None
+
+        _send_status(channel, msgType, Status.STARTING)
+        trace = start_trace(msgType) if TRACE_ALL or message.get("debug") else None
+
+        try:
+            with trace or nullcontext(), session_scope(session_id), metrics.ws_message_seconds.time(msg_type=msgType):
                 if msgType == MsgType.CHAT:
-                    plan, system_response = controller.process_user_message(msgData)
+                    plan, system_response = await asyncio.to_thread(
+                        controller.process_user_message, msgData, cancel_token=message.get("cancel_token")
+                    )
                 elif msgType == MsgType.INTERACTION:
-                    plan, system_response = controller.process_ui_interaction(msgData)
+                    plan, system_response = await asyncio.to_thread(controller.process_ui_interaction, msgData)
                 elif msgType == MsgType.EXECUTE:
-                    plan, system_response = controller.process_execution(msgData)
+                    plan, system_response = await asyncio.to_thread(
+                        controller.process_execution, msgData, cancel_token=message.get("cancel_token")
+                    )
                 elif msgType == MsgType.RESET:
                     plan, system_response, chat_history = controller.reset()
+                    channel.send({"type": MsgType.RESET, "data": {}})
 
                 print("plan:", plan)
                 # if plan:
@@ -104,41 +236,60 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     # print("plan-back", b.nodes(data=True))
                     # print("plan-back", b.edges(data=True, keys=True))
                 print("response:", system_response)
+                # queued after everything streamed while producing them
                 if plan:
-                    await _send_plan(websocket, PlanConverter.dag_to_UIPlan(plan))
+                    with span("plan_conversion"):
+                        ui_plan = PlanConverter.dag_to_UIPlan(plan)
+                    with span("send_plan"):
+                        _send_plan(channel, ui_plan)
                 if system_response:
-                    await _send_chat(websocket, system_response, chat_history)
+                    with span("send_chat"):
+                        _send_chat(channel, system_response, chat_history)
+        except Exception:
+            metrics.errors_total.inc(stage="websocket")
+            _send_status(channel, msgType, Status.ERROR)
+            raise
 
-                await _send_status(websocket, msgType, Status.FINISHED)
+        timing = None
+        if trace:
+            timing = trace.to_dict()
+            session_traces.setdefault(session_id, deque(maxlen=50)).append(timing)
+        _send_status(channel, msgType, Status.FINISHED, timing=timing)
 
-    except WebSocketDisconnect:
-        print(f"[{current_time()}] Client disconnected from session: {session_id}")
-    except Exception as e:
-        print(f"[{current_time()}] Error:", e, traceback.format_exc())
-    finally:
-        await websocket.close()
-        print(f"[{current_time()}] WebSocket closed for session: {session_id}")
+    return channel, SessionDispatcher(handle_message)
 
 
-async def _send_status(websocket: WebSocket, action: str, status: str) -> None:
-    await websocket.send_json(
-        {"type": MsgType.STATUS, "data": {"action": action, "status": status}}
-    )
+def _send_snapshot(outbound: OutboundQueue, controller: Controller) -> None:
+    """Brings a new subscriber up to date with the chat and the latest plan of the session."""
+    if controller.chat_history:
+        outbound.send({"type": MsgType.CHAT, "data": {"chat_history": controller.chat_history}})
+    plan = controller.planner.get_latest_plan()
+    if plan:
+        _send_plan(outbound, PlanConverter.dag_to_UIPlan(plan.dag))
+
+
+def _send_status(
+    outbound: OutboundQueue | SessionChannel, action: str, status: str, timing: dict | None = None
+) -> None:
+    data = {"action": action, "status": status}
+    if timing:
+        data["timing"] = timing
+    outbound.send({"type": MsgType.STATUS, "data": data})
 
 
-async def _send_chat(
-    websocket: WebSocket,
+def _send_chat(
+    outbound: OutboundQueue | SessionChannel,
     system_response: SystemMessage,
     chat_history: list[Message] = [],
 ) -> None:
     data = {"system_response": system_response}
     if chat_history:
         data["chat_history"] = chat_history
-    await websocket.send_json({"type": MsgType.CHAT, "data": data})
+    outbound.send({"type": MsgType.CHAT, "data": data})
 
 
-async def _send_plan(websocket: WebSocket, plan: UIPlan) -> None:
-    await websocket.send_json({"type": MsgType.PLAN, "data": {"plan": plan}})
+def _send_plan(outbound: OutboundQueue | SessionChannel, plan: UIPlan) -> None:
+    outbound.send({"type": MsgType.PLAN, "data": {"plan": plan}})
 
 
 dist_dir_path = "frontend/dist"
@@ -146,4 +297,20 @@ Path(dist_dir_path).mkdir(parents=True, exist_ok=True)
 app.mount("/", StaticFiles(directory=dist_dir_path, html=True), name="dist")
 
 if __name__ == "__main__":
-    uvicorn.run("server:app", reload=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of session shards; more than one starts the shard router",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        from router import create_app
+
+        uvicorn.run(create_app(args.workers), host=args.host, port=args.port)
+    else:
+        uvicorn.run("server:app", host=args.host, port=args.port, reload=True)
@@ -13,31 +13,267 @@ def add_edges(edges):
         graph[u].append(v)
     return graph
 
-def dfs(graph, v, visited, rec_stack):
-    visited[v] = True
-    rec_stack[v] = True
-    for neighbor in graph[v]:
-        if not visited[neighbor]:
-            if dfs(graph, neighbor, visited, rec_stack):
-                return True
-        elif rec_stack[neighbor]:
-            return True
-    rec_stack[v] = False
-    return False
+def find_cycle(graph, vertices=None):
+    '''
+    Iterative DFS over an adjacency mapping (dict of lists, or a networkx graph's `succ`).
+    Returns the first cycle found as a list of vertices [v0, v1, ..., v0], or None if the graph is acyclic.
+    '''
+    vertices = graph.keys() if vertices is None else vertices
+    state = {}  # vertex -> 1 while on the DFS stack, 2 once finished
+    for root in vertices:
+        if root in state:
+            continue
+        state[root] = 1
+        path = [root]
+        stack = [iter(graph.get(root, ()))]
+        while stack:
+            neighbor = next(stack[-1], None)
+            if neighbor is None:
+                state[path.pop()] = 2
+                stack.pop()
+                continue
+            if state.get(neighbor) == 1:
+                return path[path.index(neighbor):] + [neighbor]
+            if neighbor not in state:
+                state[neighbor] = 1
+                path.append(neighbor)
+                stack.append(iter(graph.get(neighbor, ())))
+    return None
 
 def validate_dag(edges):
     '''
-    Returns True if graph is a valid DAG, False otherwise. 
+    Returns True if graph is a valid DAG, False otherwise.
     '''
     graph = add_edges(edges)
-    V = get_unique_vertices(edges)
-    visited = {node: False for node in V}
-    rec_stack = {node: False for node in V}
-    for node in V:
-        if not visited[node]:
-            if dfs(graph, node, visited, rec_stack):
-                return False
-    return True
+    return find_cycle(graph, get_unique_vertices(edges)) is None
+
+def check_plan_structure(dag, agent_registry=None):
+    '''
+    Checks a plan MultiDiGraph for everything that would make its execution fail: cycles,
+    unbound inputs, edges naming an output or input their nodes do not have and, given an
+    agent registry, unknown agents and nodes that do not fit their agent's metadata
+    (min_inputs, num_outputs, numeric_inputs). Unused outputs are reported as warnings.
+    Returns a list of problems, each a dict with "code", "severity", "node" and "message";
+    edge problems also have "edge": [src, dest, src_output, dest_input].
+    '''
+    problems = []
+    cycle = find_cycle(dag.succ)
+    if cycle:
+        problems.append({
+            "code": "cycle",
+            "severity": "error",
+            "node": cycle[0],
+            "cycle": cycle,
+            "message": f"Plan contains a cycle: {' -> '.join(str(n) for n in cycle)}",
+        })
+
+    for src, dest, d in dag.edges(data=True):
+        edge = [src, dest, d.get("src_output"), d.get("dest_input")]
+        if d.get("src_output") not in (dag.nodes[src].get("output") or []):
+            problems.append({
+                "code": "unknown_output",
+                "severity": "error",
+                "node": src,
+                "edge": edge,
+                "message": f"Edge {src} -> {dest} reads output '{d.get('src_output')}', which node {src} does not have",
+            })
+        if d.get("dest_input") not in [name for name, _ in dag.nodes[dest].get("input") or []]:
+            problems.append({
+                "code": "unknown_input",
+                "severity": "error",
+                "node": dest,
+                "edge": edge,
+                "message": f"Edge {src} -> {dest} writes input '{d.get('dest_input')}', which node {dest} does not have",
+            })
+
+    sinks = [n for n in dag.nodes if dag.out_degree(n) == 0]
+    for node_id, node in dag.nodes(data=True):
+        inputs = node.get("input") or []
+        outputs = node.get("output") or []
+        bound_inputs = {d.get("dest_input") for _, _, d in dag.in_edges(node_id, data=True)}
+        for name, value in inputs:
+            if name not in bound_inputs and value in (None, ""):
+                problems.append({
+                    "code": "missing_input",
+                    "severity": "error",
+                    "node": node_id,
+                    "input": name,
+                    "message": f"Node {node_id} input '{name}' has no value and no incoming edge",
+                })
+        if agent_registry is not None:
+            problems.extend(_check_agent(node_id, node, bound_inputs, agent_registry))
+        if node_id in sinks and len(sinks) == 1:
+            continue
+        used_outputs = {d.get("src_output") for _, _, d in dag.out_edges(node_id, data=True)}
+        for name in outputs:
+            if name not in used_outputs:
+                problems.append({
+                    "code": "dangling_output",
+                    "severity": "warning",
+                    "node": node_id,
+                    "output": name,
+                    "message": f"Node {node_id} output '{name}' is not used by any node",
+                })
+    return problems
+
+def _check_agent(node_id, node, bound_inputs, agent_registry):
+    '''Checks a node against the metadata of its agent; see check_plan_structure().'''
+    name = node.get("name")
+    agent = agent_registry.get_agent(name)
+    if agent is None:
+        return [{
+            "code": "unknown_agent",
+            "severity": "error",
+            "node": node_id,
+            "message": f"Node {node_id} uses unknown agent '{name}'",
+        }]
+    problems = []
+    inputs = node.get("input") or []
+    outputs = node.get("output") or []
+    if len(inputs) < agent.min_inputs:
+        problems.append({
+            "code": "arity",
+            "severity": "error",
+            "node": node_id,
+            "message": f"Node {node_id} has {len(inputs)} inputs, agent '{name}' needs at least {agent.min_inputs}",
+        })
+    if agent.num_outputs is not None and len(outputs) != agent.num_outputs:
+        problems.append({
+            "code": "arity",
+            "severity": "error",
+            "node": node_id,
+            "message": f"Node {node_id} has {len(outputs)} outputs, agent '{name}' produces {agent.num_outputs}",
+        })
+    if agent.numeric_inputs:
+        for input_name, value in inputs:
+            if input_name in bound_inputs or value in (None, ""):
+                continue
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                problems.append({
+                    "code": "input_type",
+                    "severity": "error",
+                    "node": node_id,
+                    "input": input_name,
+                    "message": f"Node {node_id} input '{input_name}' is {value!r}, agent '{name}' needs a number",
+                })
+    return problems
+
+class TopologicalOrder:
+    '''
+    Topological order of a DAG kept up to date across edits (Pearce-Kelly dynamic topological sort).
+    Adding an edge only reorders the nodes whose position lies between its endpoints,
+    removing edges never reorders, and position lookups are O(1).
+    '''
+    def __init__(self, order=()):
+        self.slots = list(order)  # position -> node, None where a node was removed
+        self.position = {node: i for i, node in enumerate(self.slots)}
+        self._nodes = None
+
+    @classmethod
+    def from_graph(cls, graph):
+        '''
+        Builds the order of a networkx graph from scratch (Kahn's algorithm).
+        Raises ValueError with the offending cycle if the graph is not a DAG.
+        '''
+        indegree = {node: graph.in_degree(node) for node in graph.nodes}
+        ready = [node for node, d in indegree.items() if d == 0]
+        order = []
+        while ready:
+            node = ready.pop()
+            order.append(node)
+            for _, dest in graph.out_edges(node):
+                indegree[dest] -= 1
+                if indegree[dest] == 0:
+                    ready.append(dest)
+        if len(order) != len(indegree):
+            cycle = find_cycle(graph.succ)
+            raise ValueError(f"Plan contains a cycle: {' -> '.join(str(n) for n in cycle)}")
+        return cls(order)
+
+    def copy(self):
+        return TopologicalOrder(self.nodes())
+
+    def nodes(self):
+        '''Nodes in topological order, as a tuple so callers cannot corrupt the cached order.'''
+        if self._nodes is None:
+            self._nodes = tuple(node for node in self.slots if node is not None)
+        return self._nodes
+
+    def index(self, node):
+        '''Relative position of a node; u precedes v iff index(u) < index(v).'''
+        return self.position[node]
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __len__(self):
+        return len(self.position)
+
+    def __contains__(self, node):
+        return node in self.position
+
+    def add_node(self, node):
+        self.position[node] = len(self.slots)
+        self.slots.append(node)
+        self._nodes = None
+
+    def remove_node(self, node):
+        self.slots[self.position.pop(node)] = None
+        self._nodes = None
+        if len(self.slots) > 2 * len(self.position) + 8:
+            # compact the holes left by removed nodes
+            self.slots = list(self.nodes())
+            self.position = {node: i for i, node in enumerate(self.slots)}
+
+    def add_edge(self, graph, src, dest):
+        '''
+        Updates the order for a new edge src -> dest, before it is added to `graph`.
+        Returns the cycle [src, dest, ..., src] the edge would close (leaving the order untouched), or None.
+        '''
+        if src == dest:
+            return [src, src]
+        lower, upper = self.position[dest], self.position[src]
+        if lower > upper:
+            return None
+
+        # forward from dest, restricted to nodes placed before src
+        parent = {dest: None}
+        stack = [dest]
+        while stack:
+            v = stack.pop()
+            for w in graph.succ[v]:
+                if w == src:
+                    path = [v]
+                    while parent[path[-1]] is not None:
+                        path.append(parent[path[-1]])
+                    return [src] + path[::-1] + [src]
+                if w not in parent and self.position[w] < upper:
+                    parent[w] = v
+                    stack.append(w)
+        forward = list(parent)
+
+        # backward from src, restricted to nodes placed after dest
+        seen = {src}
+        stack = [src]
+        while stack:
+            v = stack.pop()
+            for w in graph.pred[v]:
+                if w not in seen and self.position[w] > lower:
+                    seen.add(w)
+                    stack.append(w)
+        backward = list(seen)
+
+        # move everything that must precede src ahead of everything reachable from dest
+        backward.sort(key=self.position.get)
+        forward.sort(key=self.position.get)
+        slots = sorted(self.position[v] for v in backward + forward)
+        for i, v in zip(slots, backward + forward):
+            self.slots[i] = v
+            self.position[v] = i
+        self._nodes = None
+        return None
 
 def plan_adherence(llm_plan, dag_plan):
     '''
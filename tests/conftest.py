@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules live at the repository root, which pytest does not put on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
\ No newline at end of file
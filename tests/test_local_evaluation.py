@@ -0,0 +1,64 @@
+import pytest
+
+from agents.local_evaluation import evaluate_task
+
+
+@pytest.mark.parametrize("task, input_vars, output_vars, expected", [
+    ("Calculate total_cost = price * quantity", [["price", 2.5], ["quantity", 4]], ["total_cost"], {"total_cost": 10}),
+    ("Compute (a + b) / c", [["a", 2], ["b", 4], ["c", "3"]], ["x"], {"x": 2}),
+    ("Convert minutes to hours", [["minutes", 90]], ["hours"], {"hours": 1.5}),
+    ("Convert the distance from km to m", [["distance", 2.5]], ["meters"], {"meters": 2500}),
+    ("Compute the percentage: part / whole * 100", [["part", 2], ["whole", 10]], ["pct"], {"pct": 20}),
+    # operations on two inputs named in prose, as the planner writes its tasks
+    ("Calculate total number of fruits in all clusters by multiplying the number of clusters with the number of fruits per cluster",
+     [["num_clusters", 6], ["fruits_per_cluster", 20]], ["total_fruits_in_clusters"], {"total_fruits_in_clusters": 120}),
+    ("Find the total number of raspberries by adding the total number of fruits in clusters with total number of individual fruits",
+     [["total_fruits_in_clusters", 120], ["total_individual_fruits", 7]], ["total_raspberries"], {"total_raspberries": 127}),
+    ("Find the change by subtracting the cost from the amount paid", [["cost", 7], ["amount_paid", 10]], ["change"], {"change": 3}),
+    ("Find the speed by dividing the distance by the time", [["distance", 120], ["time", 2]], ["speed"], {"speed": 60}),
+    # aggregates of all the inputs
+    ("Find the average of a, b and c", [["a", 2], ["b", 4], ["c", 6]], ["avg"], {"avg": 4}),
+    ("Compute the average of a, b and c: (a + b + c) / 3", [["a", 2], ["b", 4], ["c", 6]], ["avg"], {"avg": 4}),
+    ("Find the maximum of the first score and the second score", [["first_score", 3], ["second_score", 9]], ["best"], {"best": 9}),
+    ("Find the smallest of x, y and z", [["x", 3], ["y", 1], ["z", 2]], ["least"], {"least": 1}),
+    # percentages
+    ("Compute 20% of the bill", [["bill", "$50"]], ["tip"], {"tip": 10}),
+    ("Compute rate percent of price", [["rate", 15], ["price", 40]], ["amount"], {"amount": 6}),
+    ("Express the red balls as a percentage of the total balls", [["red_balls", 2], ["total_balls", 10]], ["red_pct"], {"red_pct": 20}),
+])
+def test_pure_operations_are_computed(task, input_vars, output_vars, expected):
+    assert evaluate_task(task, input_vars, output_vars) == expected
+
+
+@pytest.mark.parametrize("task, input_vars, output_vars", [
+    # quantities the inputs do not directly give
+    ("Find the minimum number of buses needed", [["students", 130], ["seats_per_bus", 40]], ["buses"]),
+    ("Find the maximum number of cookies each child gets", [["cookies", 25], ["children", 4]], ["cookies_per_child"]),
+    ("Calculate the average speed", [["distance", 120], ["time", 2]], ["speed"]),
+    ("What percent of the total is left after spending", [["spent", 30], ["total", 100]], ["percent_left"]),
+    ("Compute the total cost including a 15% tip", [["bill", 40]], ["total_cost"]),
+    ("Add (price per apple times number of apples) and bananas", [["price", 2], ["apples", 3], ["bananas", 5]], ["total"]),
+    # formulas that do not cover exactly the inputs
+    ("total = price * quantity", [["price", 2], ["quantity", 3], ["shipping", 5]], ["total"]),
+    ("Compute a + b and a - b", [["a", 2], ["b", 1]], ["x"]),
+    # readings that disagree, or lists that do not name exactly the inputs
+    ("Compute the average of a and b: a + b", [["a", 2], ["b", 4]], ["x"]),
+    ("Find the sum of a and b by c", [["a", 1], ["b", 2], ["c", 3]], ["x"]),
+    ("Compute the sum of the prices", [["price_a", 1], ["price_b", 2]], ["total"]),
+    # no operation, several outputs, non-numeric inputs
+    ("Compute the total cost", [["price", 2], ["quantity", 3]], ["total"]),
+    ("x = a + b", [["a", 1], ["b", 2]], ["x", "y"]),
+    ("x = a + b", [["a", "unknown"], ["b", 2]], ["x"]),
+])
+def test_ambiguous_tasks_are_left_to_the_llm(task, input_vars, output_vars):
+    assert evaluate_task(task, input_vars, output_vars) is None
+
+
+@pytest.mark.parametrize("task, input_vars", [
+    ("compute x ** 100 * 10 ** 100", [["x", 1000]]),
+    ("compute x ** 100 * x ** 100 * x", [["x", 1e300]]),
+    ("compute a / b", [["a", 1], ["b", 0]]),
+    ("compute a ** b", [["a", 2], ["b", 1000]]),
+])
+def test_unrepresentable_results_are_left_to_the_llm(task, input_vars):
+    assert evaluate_task(task, input_vars, ["x"]) is None
\ No newline at end of file
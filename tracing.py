@@ -0,0 +1,69 @@
+import contextvars
+import time
+from contextlib import nullcontext
+
+# innermost open span of the message being handled; None when tracing is off
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+_disabled = nullcontext()
+
+
+class Span:
+    """
+    A timed step of a handled message, with nested child steps.
+
+    Attributes:
+        name (str): Step name, e.g. "intent_classification".
+        attrs (dict): Extra fields reported with the span, e.g. the node id.
+        children (list[Span]): Nested steps in start order.
+    """
+    __slots__ = ("name", "attrs", "children", "start", "end", "_parent", "_token")
+
+    def __init__(self, name: str, attrs: dict, parent: "Span | None" = None):
+        self.name = name
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self.start = self.end = None
+        self._parent = parent
+
+    def __enter__(self) -> "Span":
+        if self._parent is not None:
+            self._parent.children.append(self)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.end = time.perf_counter()
+        _current_span.reset(self._token)
+
+    @property
+    def duration_ms(self) -> float | None:
+        if self.start is None or self.end is None:
+            return None
+        return round((self.end - self.start) * 1000, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "ms": self.duration_ms,
+            **self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def span(name: str, **attrs):
+    """
+    Times the `with` block as a child of the current span.
+    Returns a shared no-op context when no trace is active, so disabled tracing costs one lookup.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _disabled
+    return Span(name, attrs, parent)
+
+
+def start_trace(name: str, **attrs) -> Span:
+    """Returns a root span; spans opened inside its `with` block become its children."""
+    return Span(name, attrs)
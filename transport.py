@@ -0,0 +1,173 @@
+import importlib.util
+import os
+import threading
+from functools import cache
+
+from metrics import CallbackMetric
+
+# httpx and requests are imported by the factories below, on the first request to an upstream,
+# so that starting the server does not load them
+
+# pool tuning, shared by every upstream
+POOL_SIZE = int(os.environ.get("AIPOM_HTTP_POOL_SIZE", 64))
+KEEPALIVE_SECONDS = float(os.environ.get("AIPOM_HTTP_KEEPALIVE", 60))
+USE_HTTP2 = os.environ.get("AIPOM_HTTP2", "1") != "0"
+
+
+class ConnectionStats:
+    """
+    Counts requests and newly opened connections for one upstream.
+
+    Attributes:
+        requests (int): Requests sent.
+        new_connections (int): TCP connections opened; the rest of the requests reused a pooled one.
+        http2 (bool): Whether the upstream client negotiates HTTP/2.
+    """
+    def __init__(self, http2: bool = False):
+        self.requests = 0
+        self.new_connections = 0
+        self.http2 = http2
+        self._lock = threading.Lock()
+
+    def add(self, requests: int = 0, new_connections: int = 0) -> None:
+        with self._lock:
+            self.requests += requests
+            self.new_connections += new_connections
+
+    def as_dict(self) -> dict:
+        reused = max(0, self.requests - self.new_connections)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": reused / self.requests if self.requests else None,
+            "http2": self.http2,
+        }
+
+
+_stats: dict[str, ConnectionStats] = {}
+_httpx_clients: dict[str, "httpx.Client"] = {}
+_sessions: dict[str, "requests.Session"] = {}
+_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    return USE_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def get_httpx_client(upstream: str) -> "httpx.Client":
+    """
+    Returns the pooled keep-alive httpx client for an upstream, creating it on first use.
+    Used as the `http_client` of the OpenAI-compatible API clients.
+
+    Args:
+        upstream (str): Name of the upstream service, e.g. "openai".
+
+    Returns:
+        httpx.Client: A client shared by every caller of that upstream.
+    """
+    with _lock:
+        if upstream not in _httpx_clients:
+            import httpx
+            from openai import DefaultHttpxClient  # keeps the SDK's default timeouts
+
+            http2 = http2_available()
+            stats = _stats[upstream] = ConnectionStats(http2=http2)
+
+            def trace(event: str, info: dict) -> None:
+                if event == "connection.connect_tcp.complete":
+                    stats.add(new_connections=1)
+
+            def on_request(request: httpx.Request) -> None:
+                stats.add(requests=1)
+                request.extensions["trace"] = trace
+
+            _httpx_clients[upstream] = DefaultHttpxClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=POOL_SIZE,
+                    max_keepalive_connections=POOL_SIZE,
+                    keepalive_expiry=KEEPALIVE_SECONDS,
+                ),
+                event_hooks={"request": [on_request]},
+            )
+        return _httpx_clients[upstream]
+
+
+@cache
+def _counting_adapter_class() -> type:
+    """Defines the requests adapter counting into ConnectionStats once requests is needed."""
+    from requests.adapters import HTTPAdapter
+
+    class _CountingAdapter(HTTPAdapter):
+        """HTTPAdapter that reports requests and new urllib3 connections to ConnectionStats."""
+        def __init__(self, stats: ConnectionStats, **kwargs):
+            self.stats = stats
+            super().__init__(**kwargs)
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            stats = self.stats
+
+            def counting(pool_cls):
+                class CountingConnection(pool_cls.ConnectionCls):
+                    def connect(self):
+                        stats.add(new_connections=1)
+                        return super().connect()
+
+                return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection})
+
+            self.poolmanager.pool_classes_by_scheme = {
+                scheme: counting(pool_cls)
+                for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+            }
+
+        def send(self, request, **kwargs):
+            self.stats.add(requests=1)
+            return super().send(request, **kwargs)
+
+    return _CountingAdapter
+
+
+def get_requests_session(upstream: str) -> "requests.Session":
+    """
+    Returns the pooled keep-alive requests session for an upstream, creating it on first use.
+
+    Args:
+        upstream (str): Name of the upstream service, e.g. "google_search".
+
+    Returns:
+        requests.Session: A session shared by every caller of that upstream.
+    """
+    with _lock:
+        if upstream not in _sessions:
+            import requests
+
+            stats = _stats[upstream] = ConnectionStats()
+            adapter = _counting_adapter_class()(stats, pool_connections=4, pool_maxsize=POOL_SIZE)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[upstream] = session
+        return _sessions[upstream]
+
+
+def get_transport_stats() -> dict[str, dict]:
+    """Returns request and connection reuse counts per upstream."""
+    return {upstream: stats.as_dict() for upstream, stats in _stats.items()}
+
+
+CallbackMetric(
+    "aipom_http_requests_total",
+    "HTTP requests sent per upstream",
+    ("upstream",),
+    collect=lambda: {(upstream,): stats.requests for upstream, stats in _stats.items()},
+    kind="counter",
+)
+CallbackMetric(
+    "aipom_http_new_connections_total",
+    "HTTP connections opened per upstream",
+    ("upstream",),
+    collect=lambda: {(upstream,): stats.new_connections for upstream, stats in _stats.items()},
+    kind="counter",
+)
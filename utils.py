@@ -2,19 +2,75 @@ import json
 import os
 import time
 import uuid
+from functools import cache
 from graphlib import TopologicalSorter
+from pathlib import Path
 
-from openai import OpenAI
+from execution_policy import attempt_timeout
 
-# LLM API clients
-openai_client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    organization=os.environ.get("OPENAI_ORGANIZATION", None),
-)
-fireworks_client = OpenAI(
-    api_key=os.environ.get("FIREWORKS_API_KEY"),
-    base_url=os.environ.get("FIREWORKS_API_BASE"),
-)
+# constants shared with the frontend, resolved next to this file rather than the cwd
+CONSTANTS_PATH = Path(__file__).parent / "frontend" / "public" / "constants.json"
+
+
+# LLM API clients, each built on first use on its own pooled keep-alive transport;
+# importing the OpenAI SDK alone takes most of a second
+@cache
+def get_openai_client():
+    from openai import OpenAI
+
+    from transport import get_httpx_client
+
+    return OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        organization=os.environ.get("OPENAI_ORGANIZATION", None),
+        http_client=get_httpx_client("openai"),
+    )
+
+
+@cache
+def _get_agent_openai_client():
+    return get_openai_client().with_options(max_retries=0)
+
+
+def get_agent_openai_client():
+    """
+    OpenAI client for agent calls, which run under an ExecutionPolicy: the policy owns
+    retries, so the SDK does not retry, and a request times out with its attempt.
+    """
+    client = _get_agent_openai_client()
+    timeout = attempt_timeout()
+    return client if timeout is None else client.with_options(timeout=timeout)
+
+
+@cache
+def get_fireworks_client():
+    from openai import OpenAI
+
+    from transport import get_httpx_client
+
+    return OpenAI(
+        api_key=os.environ.get("FIREWORKS_API_KEY"),
+        base_url=os.environ.get("FIREWORKS_API_BASE"),
+        http_client=get_httpx_client("fireworks"),
+    )
+
+
+def __getattr__(name: str):
+    # `from utils import openai_client` keeps working, building the client on access
+    if name == "openai_client":
+        return get_openai_client()
+    if name == "fireworks_client":
+        return get_fireworks_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# origins allowed to reach the backend, shared by the server and the shard router
+ALLOWED_ORIGINS = [
+    "http://localhost",
+    "http://localhost:4173",  # vite preview
+    "http://localhost:5173",  # vite dev
+    "http://localhost:8000",  # fastapi
+]
 
 
 # load comm type classes from json
@@ -23,6 +79,8 @@ class ConstantsLoader:
 
     @classmethod
     def load_from_json(cls, json_file):
+        if cls.classes:
+            return
         with open(json_file, "r") as file:
             data = json.load(file)
             for class_name, variables in data.items():
@@ -35,7 +93,7 @@ class ConstantsLoader:
                 cls.classes[class_name] = new_class
 
 
-ConstantsLoader.load_from_json("frontend/public/constants.json")
+ConstantsLoader.load_from_json(CONSTANTS_PATH)
 globals().update(ConstantsLoader.classes)
 
 # class Status: